@@ -0,0 +1,195 @@
+import argparse
+import glob
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import onnxruntime as ort
+from PIL import Image, ImageOps
+
+# CPU-only inference for the generator exported by the notebook (section 8.1).
+# Needs numpy, pillow and onnxruntime; no PyTorch or notebook code.
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+OUTPUT_SUFFIXES = {"fake": "_fake.png", "grid": "_input_vs_fake.png"}
+
+
+def make_session(model_path, intra_op_threads=0, inter_op_threads=0):
+    """CPU InferenceSession. 0 threads keeps the ONNX Runtime default."""
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = intra_op_threads
+    opts.inter_op_num_threads = inter_op_threads
+    opts.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if inter_op_threads > 1
+                           else ort.ExecutionMode.ORT_SEQUENTIAL)
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(model_path, opts, providers=["CPUExecutionProvider"])
+
+
+def load_contract(session):
+    """Preprocessing contract stored as JSON values in the model metadata."""
+    meta = session.get_modelmeta().custom_metadata_map
+    return {key: json.loads(value) for key, value in meta.items()}
+
+
+def center_crop_factor(img, factor):
+    """PIL equivalent of the notebook's center_crop_factor (torchvision center_crop)."""
+    factor = float(factor)
+    if factor >= 1.0:
+        return img
+    w, h = img.size
+    new_w, new_h = int(w * factor), int(h * factor)
+    top = int(round((h - new_h) / 2.0))
+    left = int(round((w - new_w) / 2.0))
+    return img.crop((left, top, left + new_w, top + new_h))
+
+
+def pad_to_square(img, fill=0):
+    w, h = img.size
+    if w == h:
+        return img
+    if w > h:
+        pad_top = (w - h) // 2
+        border = (0, pad_top, 0, (w - h) - pad_top)  # left, top, right, bottom
+    else:
+        pad_left = (h - w) // 2
+        border = (pad_left, 0, (h - w) - pad_left, 0)
+    return ImageOps.expand(img, border=border, fill=fill)
+
+
+def preprocess(path, contract):
+    """Same steps as the notebook's preprocess_test_A -> (3, H, W) float32 in [-1, 1]."""
+    img = Image.open(path).convert("RGB")
+    img = center_crop_factor(img, contract["a_crop_factor"])
+    img = pad_to_square(img, fill=contract["pad_fill"])
+    size = contract["img_size"]
+    img = img.resize((size, size), Image.BICUBIC)
+    x = np.asarray(img, dtype=np.float32) / 255.0
+    return ((x - 0.5) * 2.0).transpose(2, 0, 1)
+
+
+def to_image(t):
+    """(3, H, W) float -> PIL image, min-max scaled like torchvision's save_image(normalize=True)."""
+    low, high = float(t.min()), float(t.max())
+    t = (t - low) / max(high - low, 1e-5)
+    return Image.fromarray((t * 255.0 + 0.5).clip(0, 255).astype(np.uint8).transpose(1, 2, 0))
+
+
+def write_outputs(items, out_dir, outputs):
+    """items: [(base name, x, y_hat)]. Runs on a writer thread."""
+    written = []
+    for base, x, y_hat in items:
+        if "fake" in outputs:
+            path = os.path.join(out_dir, base + OUTPUT_SUFFIXES["fake"])
+            to_image(y_hat).save(path)
+            written.append(path)
+        if "grid" in outputs:
+            path = os.path.join(out_dir, base + OUTPUT_SUFFIXES["grid"])
+            to_image(np.concatenate([x, y_hat], axis=2)).save(path)  # input | fake
+            written.append(path)
+    return written
+
+
+def infer(session, paths, out_dir, batch_size=8, outputs=("fake", "grid"), writers=4):
+    """Decode the next batch and encode finished ones on thread pools while the session runs."""
+    contract = load_contract(session)
+    input_name = session.get_inputs()[0].name
+    os.makedirs(out_dir, exist_ok=True)
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+
+    def load_batch(batch):
+        return np.stack([preprocess(p, contract) for p in batch])
+
+    written = []
+    pending = deque()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=1) as decoder, ThreadPoolExecutor(max_workers=writers) as pool:
+        future = decoder.submit(load_batch, batches[0]) if batches else None
+        for i, batch in enumerate(batches):
+            x = future.result()
+            if i + 1 < len(batches):
+                future = decoder.submit(load_batch, batches[i + 1])
+            y_hat = session.run(None, {input_name: x})[0]
+            bases = [os.path.splitext(os.path.basename(p))[0] for p in batch]
+            while len(pending) >= 2 * writers:
+                written += pending.popleft().result()
+            pending.append(pool.submit(write_outputs, list(zip(bases, x, y_hat)), out_dir, outputs))
+        while pending:
+            written += pending.popleft().result()
+    seconds = time.perf_counter() - start
+    print(f"Translated {len(paths)} images in {seconds:.2f}s ({len(paths) / max(seconds, 1e-9):.2f} img/s)")
+    return written
+
+
+def bench(session, batch_sizes, iters):
+    """Latency (batch 1) and throughput (larger batches) on random inputs."""
+    contract = load_contract(session)
+    input_name = session.get_inputs()[0].name
+    size = contract["img_size"]
+    rng = np.random.default_rng(0)
+    rows = []
+    for bs in batch_sizes:
+        x = rng.uniform(-1.0, 1.0, size=(bs, 3, size, size)).astype(np.float32)
+        session.run(None, {input_name: x})  # warm-up
+        times = []
+        for _ in range(iters):
+            start = time.perf_counter()
+            session.run(None, {input_name: x})
+            times.append(time.perf_counter() - start)
+        ms = 1000.0 * float(np.median(times))
+        rows.append((bs, ms, 1000.0 * bs / ms))
+
+    print(f"\n{'batch':>5} {'ms/batch':>10} {'img/s':>8}")
+    for bs, ms, ips in rows:
+        print(f"{bs:>5} {ms:>10.1f} {ips:>8.2f}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_session_args(p):
+        p.add_argument("--model", type=str, required=True, help="generator.onnx from the notebook")
+        p.add_argument("--intra-op-threads", type=int, default=0)
+        p.add_argument("--inter-op-threads", type=int, default=0)
+
+    p_run = sub.add_parser("run", help="Translate every image in a folder")
+    add_session_args(p_run)
+    p_run.add_argument("--input", type=str, required=True)
+    p_run.add_argument("--out", type=str, required=True)
+    p_run.add_argument("--batch-size", type=int, default=8)
+    p_run.add_argument("--outputs", type=str, default="fake,grid", help="Any of: fake, grid")
+    p_run.add_argument("--writers", type=int, default=4)
+
+    p_bench = sub.add_parser("bench", help="Latency/throughput on random inputs")
+    add_session_args(p_bench)
+    p_bench.add_argument("--batch-sizes", type=str, default="1,8")
+    p_bench.add_argument("--iters", type=int, default=10)
+
+    p_info = sub.add_parser("info", help="Print the preprocessing contract")
+    add_session_args(p_info)
+
+    args = parser.parse_args()
+    session = make_session(args.model, args.intra_op_threads, args.inter_op_threads)
+    if args.command == "run":
+        outputs = tuple(o.strip() for o in args.outputs.split(",") if o.strip())
+        unknown = set(outputs) - set(OUTPUT_SUFFIXES)
+        if unknown:
+            parser.error(f"Unknown outputs: {', '.join(sorted(unknown))}")
+        paths = sorted(p for p in glob.glob(os.path.join(args.input, "*"))
+                       if p.lower().endswith(IMAGE_EXTS))
+        if not paths:
+            print(f"Error: No images found in {args.input}")
+            return
+        infer(session, paths, args.out, args.batch_size, outputs, args.writers)
+    elif args.command == "bench":
+        bench(session, [int(b) for b in args.batch_sizes.split(",") if b.strip()], args.iters)
+    else:
+        print(json.dumps(load_contract(session), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,14 +8,35 @@ Strategy:
 
 Usage:
     blender chess-set.blend --background --python chess_position_api_angled.py -- --fen "..." --view white --angle east
+
+Batch mode (one Blender session, many FENs):
+    blender chess-set.blend --background --python chess_position_api_angled.py -- --manifest jobs.jsonl
+
+    Each manifest line is a JSON object:
+    {"fen": "...", "angle": "east", "view": "white", "output": "/abs/path/frame.png"}
+    Optional per-job keys: "resolution", "samples".
+    Add --delta to re-render only the squares that changed since the previous
+    job (full keyframe every --keyframe-every jobs).
+
+Prepared snapshot (one-time setup, reused by later runs):
+    blender chess-set.blend --background --python chess_position_api_angled.py -- --prepare chess-set.prepared.blend
+    blender chess-set.prepared.blend --background --python chess_position_api_angled.py -- --fen "..."
 """
 
 import bpy
 import math
+from bpy_extras.object_utils import world_to_camera_view
 from mathutils import Vector, Matrix
 import sys
 import argparse
+import json
 import os
+import time
+
+import numpy as np
+
+# Wall-clock time the script started (after Blender launch + .blend load)
+SCRIPT_START = time.time()
 
 # ==========================
 # CONFIG
@@ -26,7 +47,36 @@ DESIRED_ANGLE_DEGREES = 25
 LENS = 26
 RES = 1024
 SAMPLES = 128
+ENGINE = "CYCLES"
+NOISE_THRESHOLD = 0.0   # adaptive sampling threshold (0 = keep the .blend setting)
+DENOISER = "OPENIMAGEDENOISE"  # "NONE" disables denoising
+MAX_BOUNCES = 0         # total light bounces (0 = keep the .blend setting)
+TIME_LIMIT = 0.0        # per-frame render time budget in seconds (0 = unlimited)
 OUT_DIR = "//renders"
+PREPARED_FLAG = "chess_prepared"
+AUTO_BORDER = True
+
+# In-process output ("cropped" mode): crop, trim and resize the render buffer
+# inside Blender and encode the final image once, instead of writing a
+# full-size PNG for the orchestrator to decode and crop again.
+OUTPUT_MODE = "raw"     # "raw" | "cropped"
+CROP_COORDS = {}        # angle -> full-frame [y_min, y_max, x_min, x_max] fallback
+BLACK_LINE_PIXELS = 7
+TARGET_SIZE = 0         # resize longest side to this (0 = keep crop size)
+CODEC = "PNG"           # "PNG" | "JPEG" | "WEBP"
+COMPRESSION = 15        # PNG compression (0-100) or JPEG/WEBP quality
+BORDER_MARGIN = 0.01  # fraction of the frame added around the projected board
+PIECE_OBJECTS = []    # names of the chess piece meshes, set once the pieces are detected/loaded
+
+# Delta rendering (manifest mode): re-render only the squares that changed
+# since the previous frame and blend the patch into it; a full keyframe every
+# --keyframe-every frames keeps indirect-light drift bounded.
+DELTA_MARGIN = 1        # extra squares around the changed ones (shadows, reflections)
+DELTA_FEATHER = 8       # linear blend width (px) at the patch edge
+
+def emit_timing(**fields):
+    """Machine-readable timing line, parsed by the orchestrator's telemetry"""
+    print("CHESS_TIMING " + json.dumps(fields), flush=True)
 
 def get_board_info():
     """Get board dimensions"""
@@ -143,7 +193,11 @@ def parse_fen(fen):
     return position
 
 def apply_fen(fen, starting_pieces, board_info):
-    """Apply FEN by moving pieces from detected starting positions"""
+    """Apply FEN by moving pieces from detected starting positions.
+
+    Returns the placement state {'position': {square: piece_char},
+    'assignment': {square: piece_name}} used by apply_fen_incremental.
+    """
     print("\n" + "="*70)
     print("APPLYING FEN")
     print("="*70)
@@ -161,6 +215,7 @@ def apply_fen(fen, starting_pieces, board_info):
         available_pieces[key].append(piece_name)
     
     pieces_used = set()
+    assignment = {}
     
     # For each target square
     for target_square, piece_type in target_position.items():
@@ -209,6 +264,7 @@ def apply_fen(fen, starting_pieces, board_info):
             obj.hide_viewport = False
             
             pieces_used.add(piece_name)
+            assignment[target_square] = piece_name
     
     # Hide unused pieces (captured)
     for piece_name in starting_pieces.keys():
@@ -219,50 +275,120 @@ def apply_fen(fen, starting_pieces, board_info):
                 obj.hide_viewport = True
     
     print(f"\n✓ Position set ({len(pieces_used)} pieces visible)")
+    return {'position': target_position, 'assignment': assignment}
+
+def square_distance(a, b):
+    """Manhattan distance between two squares (e.g. 'e2', 'e4' -> 2)"""
+    return abs(ord(a[0]) - ord(b[0])) + abs(int(a[1]) - int(b[1]))
+
+def place_piece(obj, info, target_square, square_size):
+    """Put a piece on target_square, measured from its starting transform"""
+    from_square = info['square']
+    file_diff = ord(target_square[0]) - ord(from_square[0])
+    rank_diff = int(target_square[1]) - int(from_square[1])
+    
+    # Move: +X for files right, -Y for ranks up (same convention as apply_fen)
+    location = info['start_pos'].copy()
+    location.x -= file_diff * square_size
+    location.y -= rank_diff * square_size
+    obj.location = location
+
+def set_piece_visible(obj, visible):
+    """Toggle visibility only when it actually changes (avoids depsgraph updates)"""
+    if obj.hide_render == visible:
+        obj.hide_render = not visible
+    if obj.hide_viewport == visible:
+        obj.hide_viewport = not visible
 
-def render_all_views(board_info, view='black', target_angle='all'):
-    """Render views from white or black perspective, filtering by angle"""
+def apply_fen_incremental(fen, starting_pieces, board_info, state):
+    """Apply FEN by diffing against the previous placement state.
+
+    Only pieces on squares that changed are touched: a moved piece keeps its
+    mesh (the nearest freed piece of the same type is reused), captured
+    pieces are hidden, and pieces that (re)appear, e.g. on promotion, come
+    from the pool of hidden pieces. Returns the new placement state.
+    """
     print("\n" + "="*70)
-    print(f"RENDERING ({view.upper()} VIEW) - Angle: {target_angle}")
+    print("APPLYING FEN (INCREMENTAL)")
     print("="*70)
+    print(f"FEN: {fen}\n")
     
-    center = board_info['center']
-    scale_factor = board_info['scale_factor']
+    target_position = parse_fen(fen)
+    prev_position = state['position']
+    assignment = dict(state['assignment'])
+    square_size = board_info['square_size']
     
-    camera_height = DESIRED_CAMERA_HEIGHT * scale_factor
-    angle_radians = math.radians(DESIRED_ANGLE_DEGREES)
-    horizontal_offset = camera_height * math.tan(angle_radians)
+    # Free the pieces whose square is vacated or now holds something else
+    freed = {}  # piece_type -> [(current_square, piece_name)]
+    for square, piece_type in prev_position.items():
+        if target_position.get(square) == piece_type:
+            continue
+        piece_name = assignment.pop(square, None)
+        if piece_name:
+            freed.setdefault(piece_type, []).append((square, piece_name))
     
-    # Ensure output directory exists
-    # Note: bpy.path.abspath("//renders") resolves relative to the blend file
-    abs_out_dir = bpy.path.abspath(OUT_DIR)
-    if not os.path.exists(abs_out_dir):
-        os.makedirs(abs_out_dir)
+    freed_names = {name for entries in freed.values() for _, name in entries}
+    in_use = set(assignment.values()) | freed_names
+    touched = 0
     
-    # Clean cameras
-    for obj in bpy.data.objects:
-        if obj.type == "CAMERA":
-            bpy.data.objects.remove(obj, do_unlink=True)
+    for target_square, piece_type in target_position.items():
+        if target_square in assignment:
+            continue
+        
+        piece_name = None
+        if freed.get(piece_type):
+            # Reuse the closest piece that just left its square (a normal move)
+            freed[piece_type].sort(key=lambda e: square_distance(e[0], target_square))
+            _, piece_name = freed[piece_type].pop(0)
+            freed_names.discard(piece_name)
+        else:
+            # Bring back a hidden piece of this type (promotion / missing piece)
+            idle = [(square_distance(info['square'], target_square), name)
+                    for name, info in starting_pieces.items()
+                    if info['piece_type'] == piece_type and name not in in_use]
+            if idle:
+                idle.sort()
+                piece_name = idle[0][1]
+                in_use.add(piece_name)
+        
+        if piece_name is None:
+            print(f"  Warning: No piece of type '{piece_type}' available for {target_square}")
+            continue
+        
+        obj = bpy.data.objects.get(piece_name)
+        if obj:
+            place_piece(obj, starting_pieces[piece_name], target_square, square_size)
+            set_piece_visible(obj, True)
+            assignment[target_square] = piece_name
+            touched += 1
     
-    # Setup lighting if missing
-    if not any(o.type == "LIGHT" for o in bpy.data.objects):
-        light_height = center.z + camera_height * 2
-        bpy.ops.object.light_add(type="SUN", location=(center.x, center.y, light_height))
-        bpy.context.active_object.data.energy = 3.0
+    # Whatever was freed and not reused has been captured
+    for piece_name in freed_names:
+        obj = bpy.data.objects.get(piece_name)
+        if obj:
+            set_piece_visible(obj, False)
+            touched += 1
     
-    # Render settings
-    scene = bpy.context.scene
-    scene.render.engine = "CYCLES"
-    scene.cycles.samples = SAMPLES
-    scene.render.resolution_x = RES
-    scene.render.resolution_y = RES
-    scene.render.image_settings.file_format = 'PNG'
-    scene.cycles.use_denoising = True
+    print(f"\n✓ Position updated ({touched} pieces touched, {len(assignment)} visible)")
+    return {'position': target_position, 'assignment': assignment}
+
+def reset_pieces(starting_pieces):
+    """Restore every piece to its detected starting transform and visibility"""
+    for piece_name, info in starting_pieces.items():
+        obj = bpy.data.objects.get(piece_name)
+        if obj:
+            obj.location = info['start_pos'].copy()
+            obj.hide_render = False
+            obj.hide_viewport = False
+
+def camera_views(board_info, view):
+    """Camera (location, name, point_at_center) list and z-rotation offset for a view"""
+    center = board_info['center']
+    scale_factor = board_info['scale_factor']
     
-    try:
-        scene.cycles.device = 'GPU'
-    except:
-        pass
+    camera_height = DESIRED_CAMERA_HEIGHT * scale_factor
+    angle_radians = math.radians(DESIRED_ANGLE_DEGREES)
+    horizontal_offset = camera_height * math.tan(angle_radians)
     
     # Camera positions
     camera_z = center.z + camera_height
@@ -283,6 +409,327 @@ def render_all_views(board_info, view='black', target_angle='all'):
             ((center.x + horizontal_offset, center.y, camera_z), "3_east", False),
         ]
         z_rotation_offset = 0
+    return views, z_rotation_offset
+
+def add_camera(location, point_at_center, z_rotation_offset, center):
+    bpy.ops.object.camera_add(location=location)
+    cam = bpy.context.active_object
+    
+    if point_at_center:
+        direction = center - cam.location
+        cam.rotation_euler = direction.to_track_quat("-Z", "Y").to_euler()
+    else:
+        cam.rotation_euler = (0, 0, 0)
+    
+    # Apply rotation for white/black view
+    cam.rotation_euler.z += z_rotation_offset
+    
+    cam.data.lens = LENS
+    return cam
+
+def prepared_camera_name(view, name):
+    return f"cam_{view}_{name}"
+
+def setup_lighting(board_info):
+    """Add a sun light above the board if the scene has none"""
+    if any(o.type == "LIGHT" for o in bpy.data.objects):
+        return
+    center = board_info['center']
+    camera_height = DESIRED_CAMERA_HEIGHT * board_info['scale_factor']
+    light_height = center.z + camera_height * 2
+    bpy.ops.object.light_add(type="SUN", location=(center.x, center.y, light_height))
+    bpy.context.active_object.data.energy = 3.0
+
+def apply_render_settings():
+    scene = bpy.context.scene
+    scene.render.engine = ENGINE
+    scene.render.resolution_x = RES
+    scene.render.resolution_y = RES
+    scene.render.image_settings.file_format = 'PNG'
+    
+    if ENGINE != "CYCLES":
+        # EEVEE: samples are the only quality knob that maps across engines
+        scene.eevee.taa_render_samples = SAMPLES
+        return
+    
+    scene.cycles.samples = SAMPLES
+    scene.cycles.use_denoising = DENOISER != "NONE"
+    if DENOISER != "NONE":
+        try:
+            scene.cycles.denoiser = DENOISER
+        except TypeError:
+            print(f"  Warning: Denoiser '{DENOISER}' not available; keeping {scene.cycles.denoiser}")
+    if NOISE_THRESHOLD > 0:
+        scene.cycles.use_adaptive_sampling = True
+        scene.cycles.adaptive_threshold = NOISE_THRESHOLD
+    if MAX_BOUNCES > 0:
+        scene.cycles.max_bounces = MAX_BOUNCES
+    scene.cycles.time_limit = TIME_LIMIT
+    
+    try:
+        scene.cycles.device = 'GPU'
+    except:
+        pass
+
+def board_corners():
+    """World-space corners of the "Outer frame" box, raised to the tallest piece.
+
+    Only the detected piece objects (PIECE_OBJECTS) count, so taller scenery
+    doesn't inflate the border. Hidden (captured) pieces count too, so the
+    border depends only on the camera and every position of a game gets the
+    same pixel rectangle.
+    """
+    frame = bpy.data.objects.get("Outer frame")
+    pts = [frame.matrix_world @ Vector(v) for v in frame.bound_box]
+    top_z = max(p.z for p in pts)
+    for name in PIECE_OBJECTS:
+        obj = bpy.data.objects.get(name)
+        if obj is not None:
+            top_z = max(top_z, max((obj.matrix_world @ Vector(v)).z for v in obj.bound_box))
+
+    xs = (min(p.x for p in pts), max(p.x for p in pts))
+    ys = (min(p.y for p in pts), max(p.y for p in pts))
+    zs = (min(p.z for p in pts), top_z)
+    return [Vector((x, y, z)) for x in xs for y in ys for z in zs]
+
+def projected_bounds(cam, corners):
+    """Normalized camera-view bounds (min_x, max_x, min_y, max_y) of corners plus BORDER_MARGIN"""
+    scene = bpy.context.scene
+    projected = [world_to_camera_view(scene, cam, co) for co in corners]
+    return (
+        max(0.0, min(p.x for p in projected) - BORDER_MARGIN),
+        min(1.0, max(p.x for p in projected) + BORDER_MARGIN),
+        max(0.0, min(p.y for p in projected) - BORDER_MARGIN),
+        min(1.0, max(p.y for p in projected) + BORDER_MARGIN),
+    )
+
+def apply_border(x_min, x_max, y_lo, y_hi):
+    """Set a crop-to-border render region in whole pixels (y_lo/y_hi count up from the bottom).
+
+    Returns it as full-frame pixel coordinates (top-left origin).
+    """
+    render = bpy.context.scene.render
+    render.use_border = True
+    render.use_crop_to_border = True
+    # Nudge inside the pixel so Blender lands on it whether it truncates or rounds
+    render.border_min_x = min(1.0, (x_min + 0.25) / RES)
+    render.border_max_x = min(1.0, (x_max + 0.25) / RES)
+    render.border_min_y = min(1.0, (y_lo + 0.25) / RES)
+    render.border_max_y = min(1.0, (y_hi + 0.25) / RES)
+    
+    # Camera-view y grows upwards; image rows grow downwards
+    return {
+        'resolution': RES,
+        'x_min': x_min,
+        'x_max': x_max,
+        'y_min': RES - y_hi,
+        'y_max': RES - y_lo,
+    }
+
+def set_render_border(cam):
+    """Limit Cycles to the board region as seen from cam.
+
+    Returns the border as full-frame pixel coordinates (top-left origin), so
+    the crop step can map CROP_COORDS into the border-cropped image.
+    """
+    min_x, max_x, min_y, max_y = projected_bounds(cam, board_corners())
+    return apply_border(int(min_x * RES), int(max_x * RES), int(min_y * RES), int(max_y * RES))
+
+def clear_render_border():
+    bpy.context.scene.render.use_border = False
+    bpy.context.scene.render.use_crop_to_border = False
+
+def border_report_path(image_path):
+    return os.path.splitext(bpy.path.abspath(image_path))[0] + ".border.json"
+
+def angle_from_view_name(name):
+    for angle in ('overhead', 'east', 'west'):
+        if angle in name:
+            return angle
+    return 'overhead'
+
+def ensure_viewer_node():
+    """Route the composited image to a Viewer node so its pixels are readable"""
+    scene = bpy.context.scene
+    scene.use_nodes = True
+    tree = scene.node_tree
+    viewer = next((n for n in tree.nodes if n.type == 'VIEWER'), None)
+    if viewer is None:
+        viewer = tree.nodes.new('CompositorNodeViewer')
+    if not viewer.inputs['Image'].is_linked:
+        composite = next((n for n in tree.nodes if n.type == 'COMPOSITE'), None)
+        if composite and composite.inputs['Image'].is_linked:
+            source = composite.inputs['Image'].links[0].from_socket
+        else:
+            layers = next((n for n in tree.nodes if n.type == 'R_LAYERS'), None)
+            if layers is None:
+                layers = tree.nodes.new('CompositorNodeRLayers')
+            source = layers.outputs['Image']
+        tree.links.new(source, viewer.inputs['Image'])
+    if hasattr(viewer, 'use_alpha'):
+        viewer.use_alpha = True
+    return viewer
+
+def read_viewer_pixels():
+    """Viewer node buffer as a top-down float32 (h, w, 4) array"""
+    image = bpy.data.images['Viewer Node']
+    w, h = image.size
+    pixels = np.empty(w * h * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels.reshape(h, w, 4)[::-1]
+
+def crop_buffer(img, angle, border=None):
+    """Same geometry as crop_and_save in the orchestrator, on a float RGBA buffer"""
+    # Alpha bbox via row/column reductions (uint8 alpha > 0 <=> float alpha >= 0.5/255)
+    alpha = img[:, :, 3] >= 0.5 / 255
+    rows = np.flatnonzero(alpha.any(axis=1))
+    cols = np.flatnonzero(alpha.any(axis=0))
+    if rows.size:
+        img = img[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    else:
+        coords = CROP_COORDS.get(angle)
+        if not coords:
+            return None
+        y1, y2, x1, x2 = coords
+        if border:
+            y1, y2 = y1 - border['y_min'], y2 - border['y_min']
+            x1, x2 = x1 - border['x_min'], x2 - border['x_min']
+        h, w = img.shape[:2]
+        img = img[max(0, y1):min(h, y2), max(0, x1):min(w, x2)]
+    
+    # Trim the thin black line left by the angled cameras
+    h, w = img.shape[:2]
+    if w - h == BLACK_LINE_PIXELS:
+        if angle == 'east':
+            img = img[:, BLACK_LINE_PIXELS:w]
+        elif angle == 'west':
+            img = img[:, 0:w - BLACK_LINE_PIXELS]
+    return img
+
+def write_buffer(img, filepath):
+    """Encode a top-down float RGBA buffer once with the configured codec"""
+    scene = bpy.context.scene
+    h, w = img.shape[:2]
+    out = bpy.data.images.new("chess_crop_output", w, h, alpha=True, float_buffer=True)
+    try:
+        out.pixels.foreach_set(np.ascontiguousarray(img[::-1]).ravel())
+        if TARGET_SIZE > 0 and max(w, h) != TARGET_SIZE:
+            scale = TARGET_SIZE / max(w, h)
+            out.scale(max(1, round(w * scale)), max(1, round(h * scale)))
+        
+        settings = scene.render.image_settings
+        settings.file_format = CODEC
+        settings.color_depth = '8'
+        if CODEC == 'PNG':
+            settings.color_mode = 'RGBA'
+            settings.compression = COMPRESSION
+        else:
+            settings.color_mode = 'RGB' if CODEC == 'JPEG' else 'RGBA'
+            settings.quality = COMPRESSION
+        out.save_render(bpy.path.abspath(filepath), scene=scene)
+    finally:
+        bpy.data.images.remove(out)
+
+def changed_squares(previous, position):
+    """Squares whose piece differs between two {square: piece_char} positions"""
+    return sorted(sq for sq in set(previous) | set(position) if previous.get(sq) != position.get(sq))
+
+def delta_corners(squares, board_info, margin=DELTA_MARGIN):
+    """World-space box around the given squares (+margin squares), up to the tallest piece"""
+    pad = (0.5 + margin) * board_info['square_size']
+    centers = [square_center(sq, board_info) for sq in squares]
+    xs = (min(c.x for c in centers) - pad, max(c.x for c in centers) + pad)
+    ys = (min(c.y for c in centers) - pad, max(c.y for c in centers) + pad)
+    zs = (board_info['center'].z, max(p.z for p in board_corners()))
+    return [Vector((x, y, z)) for x in xs for y in ys for z in zs]
+
+def blend_patch(frame, patch, y0, x0, feather=DELTA_FEATHER):
+    """Blend patch into frame at (y0, x0), fading in over `feather` px from its edges"""
+    h, w = patch.shape[:2]
+    region = frame[y0:y0 + h, x0:x0 + w]
+    if feather <= 0:
+        region[:] = patch
+        return
+    ramp_y = np.minimum(np.arange(h), np.arange(h)[::-1]) + 1
+    ramp_x = np.minimum(np.arange(w), np.arange(w)[::-1]) + 1
+    weight = np.clip(np.minimum(ramp_y[:, None], ramp_x[None, :]) / feather, 0.0, 1.0)
+    weight = weight[:, :, None].astype(np.float32)
+    region[:] = patch * weight + region * (1.0 - weight)
+
+def render_delta(cam, name, board_info, delta):
+    """Render the border region of cam, re-tracing only delta['squares'] if possible.
+
+    delta holds the previous frame buffer ('frame'), its 'border' and 'view',
+    and the changed 'squares' (None forces a keyframe). Returns the full
+    border-region buffer, its border and whether it was a keyframe.
+    """
+    frame_border = set_render_border(cam) if AUTO_BORDER else apply_border(0, RES, 0, RES)
+    previous = delta.get('frame')
+    squares = delta.get('squares')
+    reusable = (previous is not None and squares is not None
+                and delta.get('border') == frame_border and delta.get('view') == name)
+    if reusable and not squares:
+        return previous.copy(), frame_border, False
+    
+    if reusable:
+        min_x, max_x, min_y, max_y = projected_bounds(cam, delta_corners(squares, board_info))
+        x_min = max(frame_border['x_min'], int(min_x * RES))
+        x_max = min(frame_border['x_max'], int(math.ceil(max_x * RES)))
+        y_lo = max(RES - frame_border['y_max'], int(min_y * RES))
+        y_hi = min(RES - frame_border['y_min'], int(math.ceil(max_y * RES)))
+        if x_max > x_min and y_hi > y_lo:
+            patch_border = apply_border(x_min, x_max, y_lo, y_hi)
+            bpy.ops.render.render(write_still=False)
+            patch = read_viewer_pixels()
+            if patch.shape[:2] == (y_hi - y_lo, x_max - x_min):
+                frame = previous.copy()
+                blend_patch(frame,
+                            patch,
+                            patch_border['y_min'] - frame_border['y_min'],
+                            patch_border['x_min'] - frame_border['x_min'])
+                return frame, frame_border, False
+            print(f"  Warning: Delta patch is {patch.shape[1]}x{patch.shape[0]}, "
+                  f"expected {x_max - x_min}x{y_hi - y_lo}; rendering a keyframe")
+        frame_border = set_render_border(cam) if AUTO_BORDER else apply_border(0, RES, 0, RES)
+    
+    bpy.ops.render.render(write_still=False)
+    return read_viewer_pixels(), frame_border, True
+
+def render_all_views(board_info, view='black', target_angle='all', output_path=None, delta=None):
+    """Render views from white or black perspective, filtering by angle.
+
+    If output_path is given, the (single) selected view is written there
+    instead of OUT_DIR/<name>.png. In a prepared snapshot the baked cameras
+    and lights are reused instead of being rebuilt. With a delta state dict
+    (see render_delta) only the changed squares are re-rendered and the
+    state is updated with the new frame.
+    """
+    print("\n" + "="*70)
+    print(f"RENDERING ({view.upper()} VIEW) - Angle: {target_angle}")
+    print("="*70)
+    
+    center = board_info['center']
+    prepared = bool(bpy.context.scene.get(PREPARED_FLAG, False))
+    
+    # Ensure output directory exists
+    # Note: bpy.path.abspath("//renders") resolves relative to the blend file
+    abs_out_dir = bpy.path.abspath(OUT_DIR)
+    if not os.path.exists(abs_out_dir):
+        os.makedirs(abs_out_dir)
+    
+    if not prepared:
+        # Clean cameras
+        for obj in bpy.data.objects:
+            if obj.type == "CAMERA":
+                bpy.data.objects.remove(obj, do_unlink=True)
+        
+        # Setup lighting if missing
+        setup_lighting(board_info)
+    
+    # Render settings
+    apply_render_settings()
+    
+    views, z_rotation_offset = camera_views(board_info, view)
     
     for location, name, point_at_center in views:
         # === FILTER LOGIC ===
@@ -292,30 +739,340 @@ def render_all_views(board_info, view='black', target_angle='all'):
 
         print(f"\nRendering: {name}")
         
-        bpy.ops.object.camera_add(location=location)
-        cam = bpy.context.active_object
+        cam = bpy.data.objects.get(prepared_camera_name(view, name)) if prepared else None
+        temporary = cam is None
+        if temporary:
+            cam = add_camera(location, point_at_center, z_rotation_offset, center)
         
-        if point_at_center:
-            direction = center - cam.location
-            cam.rotation_euler = direction.to_track_quat("-Z", "Y").to_euler()
-        else:
-            cam.rotation_euler = (0, 0, 0)
+        bpy.context.scene.camera = cam
+        filepath = output_path if output_path else f"{OUT_DIR}/{name}.png"
+        bpy.context.scene.render.filepath = filepath
         
-        # Apply rotation for white/black view
-        cam.rotation_euler.z += z_rotation_offset
+        border = set_render_border(cam) if AUTO_BORDER else None
+        if border is None:
+            clear_render_border()
         
-        cam.data.lens = LENS
+        render_start = time.perf_counter()
+        crop_seconds = None
+        keyframe = None
+        if delta is not None:
+            frame, border, keyframe = render_delta(cam, name, board_info, delta)
+            delta.update(frame=frame, border=border, view=name, keyframe=keyframe)
+            if OUTPUT_MODE == "cropped":
+                crop_start = time.perf_counter()
+                frame = crop_buffer(frame, angle_from_view_name(name), border)
+                if frame is None:
+                    raise RuntimeError(f"Nothing to crop for {name}")
+                write_buffer(frame, filepath)
+                crop_seconds = time.perf_counter() - crop_start
+                border = None
+            else:
+                write_buffer(frame, filepath)
+        elif OUTPUT_MODE == "cropped":
+            bpy.ops.render.render(write_still=False)
+            crop_start = time.perf_counter()
+            cropped = crop_buffer(read_viewer_pixels(), angle_from_view_name(name), border)
+            if cropped is None:
+                raise RuntimeError(f"Nothing to crop for {name}")
+            write_buffer(cropped, filepath)
+            crop_seconds = time.perf_counter() - crop_start
+            # Already cropped: no border report for the orchestrator
+            border = None
+        else:
+            bpy.ops.render.render(write_still=True)
+        render_seconds = time.perf_counter() - render_start - (crop_seconds or 0.0)
+        emit_timing(event="render", output=bpy.path.abspath(filepath), render=render_seconds,
+                    crop=crop_seconds, keyframe=keyframe, render_end=time.time())
         
-        bpy.context.scene.camera = cam
-        bpy.context.scene.render.filepath = f"{OUT_DIR}/{name}.png"
-        bpy.ops.render.render(write_still=True)
+        # Tell the crop step where the border-cropped image sits in the full frame
+        report_path = border_report_path(filepath)
+        if border:
+            with open(report_path, "w") as f:
+                json.dump(border, f)
+        elif os.path.exists(report_path):
+            os.remove(report_path)
         
-        print(f"  ✓ Saved: {name}.png")
+        print(f"  ✓ Saved: {filepath}")
         
-        bpy.data.objects.remove(cam, do_unlink=True)
+        if temporary:
+            bpy.data.objects.remove(cam, do_unlink=True)
     
     print("\n✓ Rendering complete")
 
+def fix_board_rotation():
+    """Fix inverted board - rotate checkerboard 90 degrees around board center"""
+    plane = bpy.data.objects.get("Black & white")
+    if plane:
+        frame = bpy.data.objects.get("Outer frame")
+        frame_pts = [frame.matrix_world @ Vector(v) for v in frame.bound_box]
+        frame_min = Vector((min(p.x for p in frame_pts), min(p.y for p in frame_pts), min(p.z for p in frame_pts)))
+        frame_max = Vector((max(p.x for p in frame_pts), max(p.y for p in frame_pts), max(p.z for p in frame_pts)))
+        center = (frame_min + frame_max) / 2
+        
+        original_pos = plane.location.copy()
+        offset = original_pos - center
+        plane.rotation_euler.z = math.radians(90)
+        rot_matrix = Matrix.Rotation(math.radians(90), 3, 'Z')
+        rotated_offset = rot_matrix @ offset
+        plane.location = center + rotated_offset
+
+def prepared_sidecar_path(blend_path):
+    return os.path.splitext(blend_path)[0] + ".pieces.json"
+
+def save_prepared_scene(path, board_info, starting_pieces):
+    """Bake board fix, lights, cameras and render settings into a derived .blend.
+
+    The piece -> starting-square map and board info go to a sidecar JSON so
+    later runs can skip get_board_info / detect_starting_positions entirely.
+    """
+    print("\n" + "="*70)
+    print(f"PREPARING SCENE SNAPSHOT: {path}")
+    print("="*70)
+    
+    path = os.path.abspath(bpy.path.abspath(path))
+    
+    for obj in bpy.data.objects:
+        if obj.type == "CAMERA":
+            bpy.data.objects.remove(obj, do_unlink=True)
+    setup_lighting(board_info)
+    apply_render_settings()
+    
+    for view in ('white', 'black'):
+        views, z_rotation_offset = camera_views(board_info, view)
+        for location, name, point_at_center in views:
+            cam = add_camera(location, point_at_center, z_rotation_offset, board_info['center'])
+            cam.name = prepared_camera_name(view, name)
+    
+    bpy.context.scene[PREPARED_FLAG] = True
+    bpy.ops.wm.save_as_mainfile(filepath=path, copy=True)
+    
+    sidecar = {
+        'board_info': {
+            key: list(value) if isinstance(value, Vector) else value
+            for key, value in board_info.items()
+        },
+        'pieces': {
+            name: {
+                'square': info['square'],
+                'piece_type': info['piece_type'],
+                'start_pos': list(info['start_pos']),
+            }
+            for name, info in starting_pieces.items()
+        },
+    }
+    with open(prepared_sidecar_path(path), "w") as f:
+        json.dump(sidecar, f, indent=2)
+    
+    print(f"\n✓ Saved {path}")
+    print(f"✓ Saved {prepared_sidecar_path(path)}")
+
+def load_prepared_state():
+    """Return (board_info, starting_pieces) from a prepared snapshot, or None"""
+    if not bpy.context.scene.get(PREPARED_FLAG, False):
+        return None
+    sidecar_path = prepared_sidecar_path(bpy.data.filepath)
+    if not os.path.exists(sidecar_path):
+        print(f"  Warning: Prepared scene without sidecar ({sidecar_path}); detecting pieces")
+        return None
+    
+    with open(sidecar_path, "r") as f:
+        sidecar = json.load(f)
+    
+    board_info = {
+        key: Vector(value) if isinstance(value, list) else value
+        for key, value in sidecar['board_info'].items()
+    }
+    starting_pieces = {
+        name: {
+            'square': info['square'],
+            'piece_type': info['piece_type'],
+            'start_pos': Vector(info['start_pos']),
+        }
+        for name, info in sidecar['pieces'].items()
+    }
+    print(f"\n✓ Loaded prepared scene ({len(starting_pieces)} pieces)")
+    return board_info, starting_pieces
+
+EMPTY_FEN = "8/8/8/8/8/8/8/8"
+SPRITE_PIECES = "PNBRQKpnbrqk"
+
+def single_piece_fen(piece, square):
+    """FEN with one piece on square (e.g. 'N', 'c3' -> '8/8/8/8/8/2N5/8/8')"""
+    file_idx = ord(square[0]) - ord('a')
+    rank = int(square[1])
+    rows = []
+    for r in range(8, 0, -1):
+        if r == rank:
+            left, right = file_idx, 7 - file_idx
+            rows.append((str(left) if left else "") + piece + (str(right) if right else ""))
+        else:
+            rows.append("8")
+    return "/".join(rows)
+
+def sprite_layer_name(piece, square):
+    # Colour prefix keeps 'P'/'p' apart on case-insensitive filesystems
+    return f"{'w' if piece.isupper() else 'b'}{piece.upper()}_{square}.png"
+
+def square_center(square, board_info):
+    """Inverse of position_to_square: world-space centre of a square"""
+    square_size = board_info['square_size']
+    file_idx = ord(square[0]) - ord('a')
+    rank_idx = int(square[1]) - 1
+    x = board_info['plane_min'].x + (7 - file_idx + 0.5) * square_size
+    y = board_info['plane_max'].y - (rank_idx + 0.5) * square_size
+    return Vector((x, y, board_info['center'].z))
+
+def bake_sprites(out_dir, starting_pieces, board_info, view, angle):
+    """Render the layers used by the NumPy sprite compositor for one camera.
+
+    Layers: the empty board, then every piece type on every square alone,
+    with the board set as a shadow catcher so each layer carries the piece
+    plus its shadow over a transparent background. sprites.json records the
+    border and per-square camera distance for back-to-front compositing.
+    """
+    print("\n" + "="*70)
+    print(f"BAKING SPRITES ({view} / {angle}) -> {out_dir}")
+    print("="*70)
+    
+    global OUTPUT_MODE
+    OUTPUT_MODE = "raw"  # layers are composited before cropping
+    out_dir = bpy.path.abspath(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    scene = bpy.context.scene
+    scene.render.film_transparent = True
+    scene.render.use_persistent_data = True
+    
+    board_meshes = [o for o in bpy.data.objects if o.type == 'MESH' and o.name not in starting_pieces]
+    squares = [f"{chr(ord('a') + f)}{r}" for r in range(1, 9) for f in range(8)]
+    
+    reset_pieces(starting_pieces)
+    apply_fen(EMPTY_FEN, starting_pieces, board_info)
+    board_path = os.path.join(out_dir, "board.png")
+    render_all_views(board_info, view=view, target_angle=angle, output_path=board_path)
+    border = None
+    if AUTO_BORDER:
+        with open(border_report_path(board_path), "r") as f:
+            border = json.load(f)
+    
+    layers = {}
+    for obj in board_meshes:
+        obj.is_shadow_catcher = True
+    try:
+        for piece in SPRITE_PIECES:
+            for square in squares:
+                if piece in 'Pp' and square[1] in '18':
+                    continue
+                name = sprite_layer_name(piece, square)
+                reset_pieces(starting_pieces)
+                apply_fen(single_piece_fen(piece, square), starting_pieces, board_info)
+                render_all_views(board_info, view=view, target_angle=angle,
+                                 output_path=os.path.join(out_dir, name))
+                layers[f"{piece}{square}"] = name
+    finally:
+        for obj in board_meshes:
+            obj.is_shadow_catcher = False
+    
+    views, _ = camera_views(board_info, view)
+    cam_location = next(Vector(loc) for loc, name, _ in views if angle in name)
+    depth = {sq: (cam_location - square_center(sq, board_info)).length for sq in squares}
+    
+    with open(os.path.join(out_dir, "sprites.json"), "w") as f:
+        json.dump({
+            'angle': angle,
+            'view': view,
+            'resolution': RES,
+            'samples': SAMPLES,
+            'border': border,
+            'board': "board.png",
+            'layers': layers,
+            'depth': depth,
+        }, f, indent=2)
+    print(f"\n✓ Baked {len(layers)} piece layers + board")
+
+def load_manifest(path):
+    """Read a JSONL manifest into a list of job dicts"""
+    jobs = []
+    with open(path, "r") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"  Warning: Skipping invalid manifest line {line_no}: {e}")
+                continue
+            if not job.get('fen') or not job.get('output'):
+                print(f"  Warning: Skipping manifest line {line_no}: 'fen' and 'output' are required")
+                continue
+            jobs.append(job)
+    return jobs
+
+def run_manifest(jobs, starting_pieces, board_info, args):
+    """Render every manifest job in this Blender session.
+
+    The scene is prepared once by the caller. The first job places every
+    piece from its starting transform; later jobs only diff against the
+    previous position (apply_fen_incremental), so consecutive frames of a
+    game touch just the pieces that moved. Cycles persistent data keeps the
+    BVH and compiled shaders alive across renders. With --delta only the
+    changed squares are re-rendered and blended into the previous frame.
+    """
+    global RES, SAMPLES
+    print("\n" + "="*70)
+    print(f"BATCH RENDER ({len(jobs)} jobs)")
+    print("="*70)
+
+    bpy.context.scene.render.use_persistent_data = True
+
+    rendered = 0
+    failed = 0
+    placement = None
+    delta = {} if args.delta else None
+    since_keyframe = 0
+    for i, job in enumerate(jobs):
+        print(f"\n[{i + 1}/{len(jobs)}] {job['output']}")
+        try:
+            RES = int(job.get('resolution', args.resolution))
+            SAMPLES = int(job.get('samples', args.samples))
+            out_dir = os.path.dirname(job['output'])
+            if out_dir:
+                os.makedirs(out_dir, exist_ok=True)
+
+            previous = placement['position'] if placement else None
+            place_start = time.perf_counter()
+            if placement is None or args.full_reset:
+                reset_pieces(starting_pieces)
+                placement = apply_fen(job['fen'], starting_pieces, board_info)
+            else:
+                placement = apply_fen_incremental(job['fen'], starting_pieces, board_info, placement)
+            emit_timing(event="place", output=job['output'], place=time.perf_counter() - place_start)
+            if delta is not None:
+                keyframe_due = args.keyframe_every > 0 and since_keyframe >= args.keyframe_every - 1
+                if previous is None or keyframe_due:
+                    delta['squares'] = None
+                else:
+                    delta['squares'] = changed_squares(previous, placement['position'])
+                    print(f"  Delta: {len(delta['squares'])} changed squares")
+            render_all_views(board_info,
+                             view=job.get('view', args.view),
+                             target_angle=job.get('angle', args.angle),
+                             output_path=job['output'],
+                             delta=delta)
+            if delta is not None:
+                since_keyframe = 0 if delta['keyframe'] else since_keyframe + 1
+            rendered += 1
+        except Exception as e:
+            print(f"  Warning: Job failed ({job['output']}): {e}")
+            failed += 1
+            # Scene state is unknown after a failure; start the next job from scratch
+            placement = None
+            if delta is not None:
+                delta.clear()
+
+    print(f"\n✓ Batch complete ({rendered} rendered, {failed} failed)")
+    return failed
+
 def main():
     argv = sys.argv
     if "--" in argv:
@@ -327,49 +1084,131 @@ def main():
     parser.add_argument('--fen', type=str, default="rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR")
     parser.add_argument('--resolution', type=int, default=800)
     parser.add_argument('--samples', type=int, default=128)
+    parser.add_argument('--engine', type=str, default='CYCLES',
+                        choices=['CYCLES', 'BLENDER_EEVEE', 'BLENDER_EEVEE_NEXT'])
+    parser.add_argument('--noise-threshold', type=float, default=0.0,
+                        help='Cycles adaptive sampling noise threshold (0 = keep .blend setting)')
+    parser.add_argument('--denoiser', type=str, default='OPENIMAGEDENOISE',
+                        choices=['OPENIMAGEDENOISE', 'OPTIX', 'NONE'])
+    parser.add_argument('--max-bounces', type=int, default=0,
+                        help='Cycles total light bounces (0 = keep .blend setting)')
+    parser.add_argument('--time-limit', type=float, default=0.0,
+                        help='Per-frame render time budget in seconds (0 = unlimited)')
     parser.add_argument('--view', type=str, default='black', choices=['white', 'black'],
                         help='Render from white or black perspective')
     # === ADDED ARGUMENT ===
     parser.add_argument('--angle', type=str, default='all', choices=['all', 'overhead', 'east', 'west'],
                         help='Render specific angle only')
     # ======================
+    parser.add_argument('--manifest', type=str, default='',
+                        help='JSONL file of render jobs; renders all of them in this session')
+    parser.add_argument('--full-reset', action='store_true',
+                        help='Manifest mode: re-place every piece for each job instead of diffing positions')
+    parser.add_argument('--delta', action='store_true',
+                        help='Manifest mode: re-render only the squares that changed since the previous job')
+    parser.add_argument('--keyframe-every', type=int, default=10,
+                        help='Delta mode: render a full keyframe every N jobs (0 = only the first)')
+    parser.add_argument('--output', type=str, default='',
+                        help='Write the selected view to this path instead of //renders/<view>.png')
+    parser.add_argument('--threads', type=int, default=0,
+                        help='Cap Cycles render threads (0 = auto-detect all cores)')
+    parser.add_argument('--prepare', type=str, default='',
+                        help='Write a prepared .blend snapshot (+ .pieces.json sidecar) to this path and exit')
+    parser.add_argument('--no-auto-border', action='store_true',
+                        help='Render the full frame instead of only the projected board region')
+    parser.add_argument('--output-mode', type=str, default='raw', choices=['raw', 'cropped'],
+                        help="'cropped': crop/trim/resize inside Blender and write the final image once")
+    parser.add_argument('--crop-coords', type=str, default='',
+                        help='JSON {angle: [y_min, y_max, x_min, x_max]} fallback when the alpha mask is empty')
+    parser.add_argument('--black-line-pixels', type=int, default=7)
+    parser.add_argument('--target-size', type=int, default=0,
+                        help='Cropped mode: resize the longest side to this many pixels (0 = keep)')
+    parser.add_argument('--codec', type=str, default='PNG', choices=['PNG', 'JPEG', 'WEBP'])
+    parser.add_argument('--compression', type=int, default=15,
+                        help='PNG compression (0-100) or JPEG/WEBP quality')
+    parser.add_argument('--bake-sprites', type=str, default='',
+                        help='Render sprite-compositor layers for --view/--angle into this directory and exit')
+    parser.add_argument('--setup-only', action='store_true',
+                        help='Exit after scene setup (used to measure startup time)')
     
     args = parser.parse_args(argv)
     
-    global RES, SAMPLES, OUT_DIR
+    global RES, SAMPLES, OUT_DIR, AUTO_BORDER
+    global ENGINE, NOISE_THRESHOLD, DENOISER, MAX_BOUNCES, TIME_LIMIT
+    global OUTPUT_MODE, CROP_COORDS, BLACK_LINE_PIXELS, TARGET_SIZE, CODEC, COMPRESSION
+    OUTPUT_MODE = args.output_mode
+    CROP_COORDS = json.loads(args.crop_coords) if args.crop_coords else {}
+    BLACK_LINE_PIXELS = args.black_line_pixels
+    TARGET_SIZE = args.target_size
+    CODEC = args.codec
+    COMPRESSION = args.compression
+    AUTO_BORDER = not args.no_auto_border
+    ENGINE = args.engine
+    NOISE_THRESHOLD = args.noise_threshold
+    DENOISER = args.denoiser
+    MAX_BOUNCES = args.max_bounces
+    TIME_LIMIT = args.time_limit
     RES = args.resolution
     SAMPLES = args.samples
     # Ensure relative path works
     OUT_DIR = "//renders"
 
+    # Thread cap so several Blender workers can share one machine
+    if args.threads > 0:
+        bpy.context.scene.render.threads_mode = 'FIXED'
+        bpy.context.scene.render.threads = args.threads
+
     
-    # Get board info
-    board_info = get_board_info()
-    
-    # Fix inverted board - rotate checkerboard 90 degrees around board center
-    plane = bpy.data.objects.get("Black & white")
-    if plane:
-        frame = bpy.data.objects.get("Outer frame")
-        frame_pts = [frame.matrix_world @ Vector(v) for v in frame.bound_box]
-        frame_min = Vector((min(p.x for p in frame_pts), min(p.y for p in frame_pts), min(p.z for p in frame_pts)))
-        frame_max = Vector((max(p.x for p in frame_pts), max(p.y for p in frame_pts), max(p.z for p in frame_pts)))
-        center = (frame_min + frame_max) / 2
+    setup_start = time.perf_counter()
+    prepared_state = None if args.prepare else load_prepared_state()
+    if prepared_state:
+        board_info, starting_pieces = prepared_state
+    else:
+        # Get board info
+        board_info = get_board_info()
         
-        original_pos = plane.location.copy()
-        offset = original_pos - center
-        plane.rotation_euler.z = math.radians(90)
-        rot_matrix = Matrix.Rotation(math.radians(90), 3, 'Z')
-        rotated_offset = rot_matrix @ offset
-        plane.location = center + rotated_offset
-
-    # Detect starting positions
-    starting_pieces = detect_starting_positions(board_info)
+        if not bpy.context.scene.get(PREPARED_FLAG, False):
+            fix_board_rotation()
+        
+        # Detect starting positions
+        starting_pieces = detect_starting_positions(board_info)
+    PIECE_OBJECTS[:] = sorted(starting_pieces)
+    
+    mode = "prepared snapshot" if prepared_state else "cold"
+    setup_seconds = time.perf_counter() - setup_start
+    print(f"\n✓ Scene setup: {setup_seconds:.3f}s ({mode})")
+    emit_timing(event="setup", script_start=SCRIPT_START, setup=setup_seconds)
+    
+    if OUTPUT_MODE == "cropped" or args.delta:
+        ensure_viewer_node()
+    
+    if args.bake_sprites:
+        if args.angle == 'all':
+            print("Error: --bake-sprites needs a single --angle")
+            sys.exit(1)
+        bake_sprites(args.bake_sprites, starting_pieces, board_info, args.view, args.angle)
+        return
+    
+    if args.prepare:
+        save_prepared_scene(args.prepare, board_info, starting_pieces)
+        return
+    if args.setup_only:
+        return
+    
+    if args.manifest:
+        failed = run_manifest(load_manifest(args.manifest), starting_pieces, board_info, args)
+        if failed:
+            sys.exit(1)
+        return
     
     # Apply FEN
+    place_start = time.perf_counter()
     apply_fen(args.fen, starting_pieces, board_info)
+    emit_timing(event="place", output=args.output, place=time.perf_counter() - place_start)
     
     # Render (Pass the angle argument!)
-    render_all_views(board_info, view=args.view, target_angle=args.angle)
+    render_all_views(board_info, view=args.view, target_angle=args.angle,
+                     output_path=args.output or None)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
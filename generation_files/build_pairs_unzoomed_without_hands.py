@@ -1,8 +1,18 @@
 import argparse
+import hashlib
+import io
+import json
 import os
 import random
 import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import zipfile
 
+import pack_shards
+from pipeline_db import PipelineDB, is_intact
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 RENDERS_DIR = os.path.join(CURRENT_DIR, "full_generation_without_hands")
@@ -11,6 +21,14 @@ DATASET_ROOT = os.path.join(
     "Project 1,2,3 - Labeled Chess data (PGN games will be added later)-20251227",
 )
 OUTPUT_ROOT = os.path.join(CURRENT_DIR, "pairs_unzoomed_without_hands")
+# Every pair already shipped (split side + file signatures), for --incremental
+MANIFEST_PATH = os.path.join(CURRENT_DIR, "pairs_manifest.json")
+DELTA_MANIFEST_NAME = "delta_manifest.json"
+# Written by generate_full_generation_without_hands.py; lists finished, intact renders
+PIPELINE_DB_PATH = os.path.join(CURRENT_DIR, "pipeline.sqlite")
+
+LINK_MODES = ("copy", "hardlink", "symlink", "reflink")
+FICLONE = 0x40049409  # Linux ioctl: share extents with the source (btrfs, XFS, ...)
 
 
 def parse_game_frame(filename):
@@ -35,41 +53,219 @@ def build_real_path(game_id, frame_id):
     return os.path.join(tagged_dir, frame_name)
 
 
+def hash_split(game_id, frame_id, train_split, seed):
+    """Stable train/val side of one pair, independent of which other pairs exist."""
+    digest = hashlib.sha1(f"{seed}:{game_id}:{frame_id}".encode("utf-8")).hexdigest()
+    return "train" if int(digest[:8], 16) / 0x100000000 < train_split else "val"
+
+
+def file_signature(path):
+    st = os.stat(path)
+    return [st.st_size, int(st.st_mtime)]
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
 def ensure_dir(path, overwrite=False):
     if overwrite and os.path.exists(path):
         shutil.rmtree(path)
     os.makedirs(path, exist_ok=True)
 
 
+def reflink(src, dst):
+    """Copy-on-write clone of src (APFS clonefile on macOS, FICLONE on Linux)."""
+    if sys.platform == "darwin":
+        subprocess.run(["cp", "-c", src, dst], check=True, capture_output=True)
+        return
+    import fcntl  # POSIX only; ImportError on Windows falls back to a copy in place_file
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def place_file(src, dst, mode="copy"):
+    """Materialize src at dst. Returns the mode actually used ("copy" on fallback)."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        if mode == "hardlink":
+            os.link(src, dst)
+            return mode
+        if mode == "symlink":
+            os.symlink(os.path.abspath(src), dst)
+            return mode
+        if mode == "reflink":
+            reflink(src, dst)
+            return mode
+    except (OSError, ImportError, subprocess.CalledProcessError):
+        # Cross-device link, no CoW support, no fcntl (Windows), ...
+        if os.path.lexists(dst):
+            os.remove(dst)
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def archive_root_name(archive_path):
+    name = os.path.basename(archive_path)
+    for ext in (".zip", ".tar"):
+        if name.lower().endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+
+def write_archive(archive_path, root_name, pairs, extra_files=None, extra_paths=None):
+    """Stream pairs into an uncompressed zip/tar laid out as <root>/{train,val}/{A,B}/<name>.
+
+    extra_files maps names under <root>/ to bytes, extra_paths to files on
+    disk. Written to a temp file and renamed, so a half-written archive never
+    replaces a good one.
+    """
+    extra_files = extra_files or {}
+    extra_paths = extra_paths or {}
+    tmp_path = f"{archive_path}.tmp"
+    dirs = [f"{root_name}/{split}/{side}/" for split in ("train", "val") for side in ("A", "B")]
+    if archive_path.lower().endswith(".zip"):
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for d in dirs:
+                zf.writestr(d, "")
+            for split, render_path, real_path, filename in pairs:
+                zf.write(render_path, f"{root_name}/{split}/A/{filename}")
+                zf.write(real_path, f"{root_name}/{split}/B/{filename}")
+            for name, data in extra_files.items():
+                zf.writestr(f"{root_name}/{name}", data)
+            for name, path in extra_paths.items():
+                zf.write(path, f"{root_name}/{name}")
+    else:
+        with tarfile.open(tmp_path, "w") as tf:
+            for d in dirs:
+                info = tarfile.TarInfo(d.rstrip("/"))
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                tf.addfile(info)
+            for split, render_path, real_path, filename in pairs:
+                tf.add(render_path, arcname=f"{root_name}/{split}/A/{filename}", recursive=False)
+                tf.add(real_path, arcname=f"{root_name}/{split}/B/{filename}", recursive=False)
+            for name, data in extra_files.items():
+                info = tarfile.TarInfo(f"{root_name}/{name}")
+                info.size = len(data)
+                tf.addfile(info, io.BytesIO(data))
+            for name, path in extra_paths.items():
+                tf.add(path, arcname=f"{root_name}/{name}", recursive=False)
+    os.replace(tmp_path, archive_path)
+
+
+def pack_pairs(pairs, shards_root, img_size, crop_a, crop_b):
+    """Pack the pairs into uint8 memmap shards (see pack_shards) under shards_root."""
+    written = []
+    for split in ("train", "val"):
+        split_pairs = sorted((filename, render_path, real_path)
+                             for s, render_path, real_path, filename in pairs if s == split)
+        config = pack_shards.shard_config(img_size, crop_a, crop_b)
+        out_dir = os.path.join(shards_root, pack_shards.shard_dir_name(split, config))
+        pack_shards.pack_split(split_pairs, out_dir, config)
+        print(f"Packed {split}: {len(split_pairs)} pairs -> {out_dir}")
+        written.append(out_dir)
+    return written
+
+
 def main():
     parser = argparse.ArgumentParser()
+    parser.add_argument("--renders-dir", type=str, default=RENDERS_DIR,
+                        help="Synthetic (A) images, e.g. full_generation_sprites for sprite composites")
     parser.add_argument("--seed", type=int, default=42)
     parser.add_argument("--train-split", type=float, default=0.8)
     parser.add_argument("--overwrite", action="store_true")
+    parser.add_argument("--split-mode", type=str, default="hash", choices=["hash", "shuffle"],
+                        help="hash: stable per-pair split on (game_id, frame_id); shuffle: old seeded shuffle")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only emit pairs that are new or changed since the last build (see --manifest)")
+    parser.add_argument("--pack-shards", action="store_true",
+                        help="Also store pre-processed uint8 memmap shards (<root>/shards/) for the notebook")
+    parser.add_argument("--img-size", type=int, default=pack_shards.IMG_SIZE, help="Shard resolution")
+    parser.add_argument("--crop-a", type=float, default=pack_shards.A_CROP_FACTOR,
+                        help="Shard A center-crop factor (notebook A_CROP_FACTOR_TRAIN/VAL)")
+    parser.add_argument("--crop-b", type=float, default=pack_shards.B_CROP_FACTOR,
+                        help="Shard B center-crop factor")
+    parser.add_argument("--db", type=str, default=PIPELINE_DB_PATH,
+                        help="Pipeline manifest to read finished renders from (falls back to listing the folder)")
+    parser.add_argument("--manifest", type=str, default=MANIFEST_PATH,
+                        help="Record of shipped pairs, updated after every successful build")
+    parser.add_argument("--link-mode", type=str, default="copy", choices=LINK_MODES,
+                        help="How files are placed in the output tree (falls back to copy if unsupported)")
+    parser.add_argument("--archive", type=str, default="",
+                        help="Write an uncompressed .zip or .tar for Colab instead of the output tree")
+    parser.add_argument("--archive-root", type=str, default="",
+                        help="Top-level folder inside the archive (default: archive file name)")
     args = parser.parse_args()
 
-    if not os.path.exists(RENDERS_DIR):
-        print(f"Error: renders folder not found at {RENDERS_DIR}")
+    renders_dir = args.renders_dir
+    if not os.path.exists(renders_dir):
+        print(f"Error: renders folder not found at {renders_dir}")
         return
     if not os.path.exists(DATASET_ROOT):
         print(f"Error: dataset folder not found at {DATASET_ROOT}")
         return
+    if args.archive and not args.archive.lower().endswith((".zip", ".tar")):
+        print(f"Error: --archive must end in .zip or .tar: {args.archive}")
+        return
 
-    ensure_dir(OUTPUT_ROOT, overwrite=args.overwrite)
-    train_a = os.path.join(OUTPUT_ROOT, "train", "A")
-    train_b = os.path.join(OUTPUT_ROOT, "train", "B")
-    val_a = os.path.join(OUTPUT_ROOT, "val", "A")
-    val_b = os.path.join(OUTPUT_ROOT, "val", "B")
-    for p in (train_a, train_b, val_a, val_b):
-        ensure_dir(p)
+    if args.pack_shards and args.incremental:
+        print("Error: --pack-shards needs the full dataset; run it without --incremental")
+        return
+    if args.overwrite and args.incremental and not args.archive:
+        # The delta would land in an emptied tree while the manifest still lists every pair
+        print("Error: --overwrite deletes the pairs already in the output tree; run it without --incremental")
+        return
 
-    files = [f for f in os.listdir(RENDERS_DIR) if f.lower().endswith(".png")]
-    random.Random(args.seed).shuffle(files)
+    split_settings = {"mode": args.split_mode, "seed": args.seed, "train_split": args.train_split}
+    known = {}
+    if args.incremental:
+        if args.split_mode != "hash":
+            print("Error: --incremental needs --split-mode hash (a shuffle moves existing pairs)")
+            return
+        manifest = load_manifest(args.manifest)
+        if manifest is None:
+            print(f"No manifest at {args.manifest}; building everything")
+        elif manifest["split"] != split_settings:
+            print(f"Error: split settings {split_settings} differ from the manifest's {manifest['split']}")
+            return
+        else:
+            known = manifest["pairs"]
 
-    split_idx = int(len(files) * args.train_split)
-    train_files = set(files[:split_idx])
+    # The DB only tracks the Cycles renders; other folders (e.g. sprite composites) are listed directly
+    use_db = os.path.exists(args.db) and os.path.abspath(renders_dir) == os.path.abspath(RENDERS_DIR)
+    db = PipelineDB(args.db) if use_db else None
+    files = sorted(f for f in os.listdir(renders_dir) if f.lower().endswith(".png"))
+    if db is not None:
+        # Drop outputs the DB knows are stale, failed or partially written. Files it has
+        # no row for (farm workers, --no-db runs) are kept; --adopt-existing registers them.
+        rows = db.outputs()
+        untracked = [f for f in files if f not in rows]
+        dropped = [f for f in files if f in rows and not is_intact(rows[f])]
+        files = [f for f in files if f not in rows or is_intact(rows[f])]
+        print(f"Pipeline DB {args.db}: {len(files)} usable renders, {len(dropped)} stale or unfinished dropped")
+        if untracked:
+            print(f"Warning: {len(untracked)} renders on disk have no DB row (farm or --no-db runs); "
+                  f"including them. Run the generator with --adopt-existing to register them.")
+    if args.split_mode == "shuffle":
+        random.Random(args.seed).shuffle(files)
+        split_idx = int(len(files) * args.train_split)
+        train_files = set(files[:split_idx])
 
-    copied = 0
+    pairs = []
+    records = {}
+    unchanged = 0
     skipped = 0
     skipped_names = []
 
@@ -80,27 +276,91 @@ def main():
             skipped_names.append(filename)
             continue
 
-        render_path = os.path.join(RENDERS_DIR, filename)
+        render_path = os.path.join(renders_dir, filename)
         real_path = build_real_path(game_id, frame_id)
         if not os.path.exists(real_path):
             skipped += 1
             skipped_names.append(filename)
             continue
 
-        is_train = filename in train_files
-        out_a = os.path.join(train_a if is_train else val_a, filename)
-        out_b = os.path.join(train_b if is_train else val_b, filename)
+        if filename in known:
+            split = known[filename]["split"]
+        elif args.split_mode == "hash":
+            split = hash_split(game_id, frame_id, args.train_split, args.seed)
+        else:
+            split = "train" if filename in train_files else "val"
+        record = {"split": split, "A": file_signature(render_path), "B": file_signature(real_path)}
+        if known.get(filename) == record:
+            unchanged += 1
+            continue
+        pairs.append((split, render_path, real_path, filename))
+        records[filename] = record
+
+    if args.incremental:
+        print(f"Incremental: {len(pairs)} new or changed pairs, {unchanged} unchanged")
+        if not pairs:
+            print("Nothing to do.")
+            return
+
+    if args.archive:
+        root_name = args.archive_root or archive_root_name(args.archive)
+        delta = {
+            "base_pairs": len(known),
+            "split": split_settings,
+            "pairs": [{"name": name, "split": split} for split, _, _, name in pairs],
+        }
+        extra = {}
+        if args.incremental:
+            extra[DELTA_MANIFEST_NAME] = json.dumps(delta, indent=1).encode("utf-8")
+            with open(os.path.splitext(args.archive)[0] + ".manifest.json", "w") as f:
+                json.dump(delta, f, indent=1)
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(args.archive))) as tmp_dir:
+            extra_paths = {}
+            if args.pack_shards:
+                for shard_dir in pack_pairs(pairs, tmp_dir, args.img_size, args.crop_a, args.crop_b):
+                    for name in sorted(os.listdir(shard_dir)):
+                        arcname = f"{pack_shards.SHARDS_FOLDER}/{os.path.basename(shard_dir)}/{name}"
+                        extra_paths[arcname] = os.path.join(shard_dir, name)
+            write_archive(args.archive, root_name, pairs, extra_files=extra, extra_paths=extra_paths)
+        print(f"Done. Archived pairs: {len(pairs)}, skipped: {skipped}")
+    else:
+        ensure_dir(OUTPUT_ROOT, overwrite=args.overwrite)
+        for split in ("train", "val"):
+            for side in ("A", "B"):
+                ensure_dir(os.path.join(OUTPUT_ROOT, split, side))
+
+        fallbacks = 0
+        for split, render_path, real_path, filename in pairs:
+            out_a = os.path.join(OUTPUT_ROOT, split, "A", filename)
+            out_b = os.path.join(OUTPUT_ROOT, split, "B", filename)
+            for src, dst in ((render_path, out_a), (real_path, out_b)):
+                if place_file(src, dst, args.link_mode) != args.link_mode:
+                    fallbacks += 1
+        print(f"Done. Copied pairs: {len(pairs)}, skipped: {skipped}")
+        if fallbacks:
+            print(f"Warning: {fallbacks} files fell back to a plain copy ({args.link_mode} unsupported)")
+        if args.pack_shards:
+            pack_pairs(pairs, os.path.join(OUTPUT_ROOT, pack_shards.SHARDS_FOLDER),
+                       args.img_size, args.crop_a, args.crop_b)
 
-        shutil.copy2(render_path, out_a)
-        shutil.copy2(real_path, out_b)
-        copied += 1
+    known.update(records)
+    save_manifest(args.manifest, {"split": split_settings, "pairs": known})
+    if db is not None:
+        paired = []
+        for split, _, _, filename in pairs:
+            game_id, frame_id = os.path.splitext(filename)[0].split("_")[1:3]
+            paired.append((game_id, frame_id, split))
+        db.mark_paired(paired)
+        db.close()
 
-    print(f"Done. Copied pairs: {copied}, skipped: {skipped}")
     if skipped_names:
         print("Skipped files:")
         for name in skipped_names:
             print(f"  {name}")
-    print(f"Output folder: {OUTPUT_ROOT}")
+    if args.archive:
+        print(f"Archive: {args.archive}")
+    else:
+        print(f"Output folder: {OUTPUT_ROOT}")
 
 
 if __name__ == "__main__":
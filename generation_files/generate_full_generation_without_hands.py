@@ -1,9 +1,21 @@
 import argparse
 import csv
+import hashlib
+import json
 import os
+import re
+import shutil
 import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 import cv2
+import numpy as np
+
+from render_cache import RenderCache, render_key
+from pipeline_db import PipelineDB
+from render_farm import JobQueue, default_worker_id, run_coordinator, run_worker
+from render_telemetry import Telemetry, parse_timing_lines, tail
 
 # === Paths ===
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -14,12 +26,65 @@ BASE_DATA_DIR = os.path.join(
 BLENDER_APP = "/Applications/Blender.app/Contents/MacOS/Blender"
 BLENDER_PROJECT_FOLDER = os.path.join(CURRENT_DIR, "Project2_3 2")
 BLEND_FILE = os.path.join(BLENDER_PROJECT_FOLDER, "chess-set.blend")
+# Derived snapshot with board fix, lights, cameras and render settings baked in
+PREPARED_BLEND_FILE = os.path.join(BLENDER_PROJECT_FOLDER, "chess-set.prepared.blend")
+USE_PREPARED = True
 SCRIPT_FILE = os.path.join(BLENDER_PROJECT_FOLDER, "chess_position_api_angled.py")
 OUTPUT_ROOT = os.path.join(CURRENT_DIR, "full_generation_without_hands")
+CACHE_DIR = os.path.join(CURRENT_DIR, "render_cache")
+CALIBRATION_DIR = os.path.join(CURRENT_DIR, "profile_calibration")
+TELEMETRY_LOG = os.path.join(CURRENT_DIR, "render_telemetry.jsonl")
+# Raw (uncropped) renders kept with --keep-raw, input for --recrop
+RAW_DIR = os.path.join(CURRENT_DIR, "raw_renders")
+KEEP_RAW = False
+# SQLite record of every frame's parameters, stage status and timings
+PIPELINE_DB_PATH = os.path.join(CURRENT_DIR, "pipeline.sqlite")
+PIPELINE_DB = None
+RAW_NAME_RE = re.compile(r"^game_(\d+)_(.+)_(east|west|overhead)\.png$")
 
 # === Render quality ===
 RESOLUTION = 2000
-SAMPLES = 128
+
+# Named quality profiles; "final" matches the original 128-sample settings.
+# engine: CYCLES or BLENDER_EEVEE; noise_threshold/max_bounces 0 keep the .blend value.
+RENDER_PROFILES = {
+    "draft": {
+        "engine": "CYCLES",
+        "samples": 24,
+        "noise_threshold": 0.1,
+        "denoiser": "OPENIMAGEDENOISE",
+        "max_bounces": 4,
+    },
+    "standard": {
+        "engine": "CYCLES",
+        "samples": 64,
+        "noise_threshold": 0.03,
+        "denoiser": "OPENIMAGEDENOISE",
+        "max_bounces": 8,
+    },
+    "final": {
+        "engine": "CYCLES",
+        "samples": 128,
+        "noise_threshold": 0.0,
+        "denoiser": "OPENIMAGEDENOISE",
+        "max_bounces": 0,
+    },
+}
+PROFILE = "final"
+TIME_BUDGET = 0.0  # per-frame render time limit in seconds (0 = unlimited)
+
+# === In-Blender crop ===
+# Crop, black-line trim and optional resize run on the render buffer inside
+# Blender, which writes the final image once (no full-size PNG round trip).
+IN_BLENDER_CROP = False
+TARGET_SIZE = 0        # resize longest side after cropping (0 = keep crop size)
+PNG_COMPRESSION = 15   # 0-100, Blender's PNG compression scale
+
+# === Delta rendering (batch mode) ===
+# Consecutive frames of a game differ by one move: re-render only the changed
+# squares (plus a margin) and blend them into the previous frame.
+DELTA = False
+KEYFRAME_EVERY = 10    # full re-render every N frames per session (0 = first frame only)
 
 # === Angle mapping per game ===
 GAME_CONFIG = {
@@ -61,49 +126,81 @@ def crop_black_line_by_angle(img, angle, pixels=BLACK_LINE_PIXELS):
     return img
 
 
-def crop_and_save(img_path, output_path, angle):
-    if not os.path.exists(img_path):
-        return False
-    img = cv2.imread(img_path, cv2.IMREAD_UNCHANGED)
-    if img is None:
-        return False
+def border_report_path(img_path):
+    return os.path.splitext(img_path)[0] + ".border.json"
+
+
+def read_border_report(img_path):
+    """Full-frame pixel rectangle of a border-cropped render, or None for full frames."""
+    path = border_report_path(img_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
 
+
+def alpha_bbox(alpha):
+    """(y1, y2, x1, x2) of the non-zero alpha region, or None if it is empty.
+
+    Row/column any() reductions avoid building a full-frame mask and point list.
+    """
+    rows = np.flatnonzero(alpha.any(axis=1))
+    if not rows.size:
+        return None
+    cols = np.flatnonzero(alpha.any(axis=0))
+    return rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+
+def crop_image(img, angle, border=None):
+    """Board crop of a raw render (alpha bbox, CROP_COORDS fallback, black-line trim)."""
     cropped_img = None
     if img.shape[2] >= 4:
-        alpha = img[:, :, 3]
-        coords = cv2.findNonZero((alpha > 0).astype("uint8"))
-        if coords is not None:
-            x, y, w, h = cv2.boundingRect(coords)
-            cropped_img = img[y:y + h, x:x + w]
+        bbox = alpha_bbox(img[:, :, 3])
+        if bbox is not None:
+            y1, y2, x1, x2 = bbox
+            cropped_img = img[y1:y2, x1:x2]
 
     if cropped_img is None:
         coords = CROP_COORDS.get(angle)
         if not coords:
-            return False
+            return None
         y1, y2, x1, x2 = coords
+        if border:
+            # CROP_COORDS are full-frame; shift them into the border-cropped image
+            y1, y2 = y1 - border["y_min"], y2 - border["y_min"]
+            x1, x2 = x1 - border["x_min"], x2 - border["x_min"]
         h, w = img.shape[:2]
         y1, x1 = max(0, y1), max(0, x1)
         y2, x2 = min(h, y2), min(w, x2)
         cropped_img = img[y1:y2, x1:x2]
 
-    cropped_img = crop_black_line_by_angle(cropped_img, angle)
-    cv2.imwrite(output_path, cropped_img)
+    return crop_black_line_by_angle(cropped_img, angle)
+
+
+def write_output(output_path, img):
+    # Write a temp file and rename it into place: a crash never leaves a truncated
+    # PNG, and outputs hardlinked to render cache entries are replaced, not written through
+    root, ext = os.path.splitext(output_path)
+    tmp_path = f"{root}.tmp{os.getpid()}{ext}"
+    if not cv2.imwrite(tmp_path, img):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, output_path)
     return True
 
 
-def find_generated_file(renders_dir, angle):
-    if angle == "overhead":
-        candidates = ["1_overhead.png"]
-    elif angle == "east":
-        candidates = ["2_east.png", "3_east.png"]
-    else:
-        candidates = ["3_west.png", "2_west.png"]
+def crop_and_save(img_path, output_path, angle):
+    if not os.path.exists(img_path):
+        return False
+    img = cv2.imread(img_path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return False
 
-    for name in candidates:
-        path = os.path.join(renders_dir, name)
-        if os.path.exists(path):
-            return path
-    return None
+    cropped_img = crop_image(img, angle, read_border_report(img_path))
+    if cropped_img is None:
+        return False
+    return write_output(output_path, cropped_img)
 
 
 def iter_csv_rows(csv_path):
@@ -113,39 +210,70 @@ def iter_csv_rows(csv_path):
             yield row
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--games", type=str, default="", help="Comma-separated game ids")
-    parser.add_argument("--default-angle", type=str, default="", choices=["", "east", "west", "overhead"])
-    parser.add_argument("--overwrite", action="store_true")
-    args = parser.parse_args()
+def time_blender_setup(blend_file):
+    """Wall-clock seconds for Blender to start, load blend_file and finish scene setup."""
+    start = time.perf_counter()
+    result = subprocess.run(blender_cmd("--setup-only", blend_file=blend_file), stdout=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+    return elapsed if result.returncode == 0 else None
 
-    if not os.path.exists(BASE_DATA_DIR):
-        print(f"Error: Data folder not found at {BASE_DATA_DIR}")
-        return
-    if not os.path.exists(BLENDER_APP):
-        print(f"Error: Blender app not found at {BLENDER_APP}")
-        return
 
-    if args.games:
-        games = []
-        for token in args.games.split(","):
-            token = token.strip()
-            if not token:
-                continue
-            try:
-                games.append(int(token))
-            except ValueError:
-                print(f"Warning: Skipping invalid game id '{token}'")
-    else:
-        games = sorted(GAME_CONFIG.keys())
+def prepare_scene():
+    """Write the prepared snapshot and report cold vs prepared startup time."""
+    print(f"Preparing scene snapshot: {PREPARED_BLEND_FILE}")
+    result = subprocess.run(blender_cmd("--prepare", PREPARED_BLEND_FILE, blend_file=BLEND_FILE))
+    if result.returncode != 0 or not os.path.exists(PREPARED_BLEND_FILE):
+        print("Error: Failed to write the prepared scene")
+        return False
+
+    cold = time_blender_setup(BLEND_FILE)
+    warm = time_blender_setup(PREPARED_BLEND_FILE)
+    if cold is None or warm is None:
+        print("Warning: Startup timing run failed")
+        return True
+    print(f"Startup (Blender launch + load + setup): cold {cold:.2f}s, prepared {warm:.2f}s "
+          f"({cold - warm:+.2f}s saved per Blender process)")
+    return True
 
-    os.makedirs(OUTPUT_ROOT, exist_ok=True)
-    renders_dir = os.path.join(BLENDER_PROJECT_FOLDER, "renders")
-    os.makedirs(renders_dir, exist_ok=True)
 
+def parse_games(games_arg):
+    if not games_arg:
+        return sorted(GAME_CONFIG.keys())
+    games = []
+    for token in games_arg.split(","):
+        token = token.strip()
+        if not token:
+            continue
+        try:
+            games.append(int(token))
+        except ValueError:
+            print(f"Warning: Skipping invalid game id '{token}'")
+    return games
+
+
+def is_complete_png(path):
+    """PNG signature at the start and an IEND chunk at the end (not truncated mid-write)."""
+    try:
+        with open(path, "rb") as f:
+            if f.read(8) != b"\x89PNG\r\n\x1a\n":
+                return False
+            f.seek(-12, os.SEEK_END)
+            return f.read(12) == b"\x00\x00\x00\x00IEND\xaeB`\x82"
+    except OSError:
+        return False
+
+
+def iter_jobs(games, default_angle="", overwrite=False, db=None, adopt=False):
+    """Yield one render job dict per CSV row that still needs an output.
+
+    With a PipelineDB, an existing output is only skipped when the database
+    says it was finished with the current render/crop settings and is intact.
+    adopt registers complete outputs the database has no row for (written
+    before it existed, by farm workers or by --no-db runs) as finished with
+    the current settings instead of re-rendering them.
+    """
     for game_id in games:
-        angle = GAME_CONFIG.get(game_id) or args.default_angle
+        angle = GAME_CONFIG.get(game_id) or default_angle
         if not angle:
             print(f"Warning: No angle for game {game_id}; skipping")
             continue
@@ -167,39 +295,761 @@ def main():
 
             out_name = f"game_{game_id}_{frame_id}.png"
             out_path = os.path.join(OUTPUT_ROOT, out_name)
-            if not args.overwrite and os.path.exists(out_path):
+            job = {
+                "game_id": game_id,
+                "frame_id": frame_id,
+                "fen": str(fen),
+                "angle": angle,
+                "out_path": out_path,
+            }
+            if db is not None:
+                job["params_key"] = job_cache_key(job)
+                if not overwrite and db.is_current(job):
+                    continue
+                if adopt and not overwrite and db.get(game_id, frame_id) is None and is_complete_png(out_path):
+                    db.register(job)
+                    db.mark_cropped(game_id, frame_id)
+                    continue
+                db.register(job)
+            elif not overwrite and os.path.exists(out_path):
                 continue
 
-            cmd = [
-                BLENDER_APP,
-                BLEND_FILE,
-                "--background",
-                "--python",
-                SCRIPT_FILE,
-                "--",
-                "--fen",
-                str(fen),
-                "--resolution",
-                str(RESOLUTION),
-                "--samples",
-                str(SAMPLES),
-                "--view",
-                "white",
-                "--angle",
-                angle,
-            ]
-            result = subprocess.run(cmd)
-            if result.returncode != 0:
-                print(f"Warning: Blender failed for game {game_id}, frame {frame_id}")
+            yield job
+
+
+def profile_args():
+    """Blender script flags for the active quality profile and time budget."""
+    profile = RENDER_PROFILES[PROFILE]
+    return [
+        "--samples", str(profile["samples"]),
+        "--engine", profile["engine"],
+        "--noise-threshold", str(profile["noise_threshold"]),
+        "--denoiser", profile["denoiser"],
+        "--max-bounces", str(profile["max_bounces"]),
+        "--time-limit", str(TIME_BUDGET),
+    ]
+
+
+def output_args():
+    if not IN_BLENDER_CROP:
+        return []
+    return [
+        "--output-mode", "cropped",
+        "--crop-coords", json.dumps(CROP_COORDS),
+        "--black-line-pixels", str(BLACK_LINE_PIXELS),
+        "--target-size", str(TARGET_SIZE),
+        "--codec", "PNG",
+        "--compression", str(PNG_COMPRESSION),
+    ]
+
+
+def active_blend_file():
+    if USE_PREPARED and os.path.exists(PREPARED_BLEND_FILE):
+        return PREPARED_BLEND_FILE
+    return BLEND_FILE
+
+
+def blender_cmd(*script_args, blend_file=None):
+    return [
+        BLENDER_APP,
+        blend_file or active_blend_file(),
+        "--background",
+        "--python",
+        SCRIPT_FILE,
+        "--",
+        "--resolution",
+        str(RESOLUTION),
+        *profile_args(),
+        *output_args(),
+        "--view",
+        "white",
+        *script_args,
+    ]
+
+
+def raw_render_path(renders_dir, job):
+    """Per-job raw render path, so concurrent Blender runs never share a file."""
+    return os.path.join(
+        renders_dir, "jobs", f"game_{job['game_id']}_{job['frame_id']}_{job['angle']}.png"
+    )
+
+
+def threads_per_worker(workers):
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def remove_raw_render(raw_path):
+    for path in (raw_path, border_report_path(raw_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def render_settings_path(raw_path):
+    return os.path.splitext(raw_path)[0] + ".render.json"
+
+
+def keep_raw_render(raw_path):
+    """Move a raw render (and its border report) into RAW_DIR for later --recrop runs.
+
+    A .render.json sidecar records the render settings it was made with, so a
+    re-crop can rebuild the row's params_key without assuming today's settings.
+    """
+    os.makedirs(RAW_DIR, exist_ok=True)
+    for path in (raw_path, border_report_path(raw_path)):
+        if os.path.exists(path):
+            shutil.move(path, os.path.join(RAW_DIR, os.path.basename(path)))
+    with open(render_settings_path(os.path.join(RAW_DIR, os.path.basename(raw_path))), "w") as f:
+        json.dump(render_settings(), f)
+
+
+def finish_job(job):
+    """Crop a job's raw render into OUTPUT_ROOT and drop (or keep) the raw file."""
+    game_id, frame_id = job["game_id"], job["frame_id"]
+    if not os.path.exists(job["raw_path"]):
+        print(f"Warning: Render not found for game {game_id}, frame {frame_id}")
+        return False
+    if IN_BLENDER_CROP:
+        # Blender already wrote the final crop
+        os.replace(job["raw_path"], job["out_path"])
+        return True
+    if not crop_and_save(job["raw_path"], job["out_path"], job["angle"]):
+        print(f"Warning: Failed to crop for game {game_id}, frame {frame_id}")
+        return False
+    if KEEP_RAW:
+        keep_raw_render(job["raw_path"])
+        return True
+    remove_raw_render(job["raw_path"])
+    return True
+
+
+def render_settings():
+    """Render-side parameters of an output (everything in its key except the crop)."""
+    return {
+        "resolution": RESOLUTION,
+        "profile": RENDER_PROFILES[PROFILE],
+        "time_budget": TIME_BUDGET,
+        "in_blender_crop": [TARGET_SIZE, PNG_COMPRESSION] if IN_BLENDER_CROP else None,
+        "delta": KEYFRAME_EVERY if DELTA else None,
+    }
+
+
+def job_cache_key(job, render=None):
+    """Key of a job's output: render settings (default: this run's) plus the current crop settings."""
+    # Cached entries are cropped outputs, so crop parameters are part of the key
+    render = render or render_settings()
+    return render_key(
+        job["fen"], job["angle"], "white", render["resolution"], render["profile"]["samples"],
+        extra={
+            "crop": CROP_COORDS.get(job["angle"]),
+            "black_line": BLACK_LINE_PIXELS,
+            "profile": render["profile"],
+            "time_budget": render["time_budget"],
+            "in_blender_crop": render["in_blender_crop"],
+            "delta": render["delta"],
+        },
+    )
+
+
+def resolve_from_cache(jobs, cache):
+    """Serve cache hits and collapse duplicate positions.
+
+    Returns (to_render, duplicates): one job per uncached key, plus the jobs
+    that share a key with a job being rendered in this run.
+    """
+    to_render = []
+    duplicates = []
+    seen = set()
+    for job in jobs:
+        job["cache_key"] = job_cache_key(job)
+        if job["cache_key"] in seen:
+            duplicates.append(job)
+            continue
+        if cache.fetch(job["cache_key"], job["out_path"]):
+            if PIPELINE_DB is not None:
+                PIPELINE_DB.mark_cropped(job["game_id"], job["frame_id"])
+            continue
+        seen.add(job["cache_key"])
+        to_render.append(job)
+    return to_render, duplicates
+
+
+def store_in_cache(rendered, duplicates, cache):
+    for job in rendered:
+        if os.path.exists(job["out_path"]):
+            cache.store(job["cache_key"], job["out_path"])
+    for job in duplicates:
+        if not cache.fetch(job["cache_key"], job["out_path"]):
+            print(f"Warning: No render for duplicate position game {job['game_id']}, frame {job['frame_id']}")
+        elif PIPELINE_DB is not None:
+            PIPELINE_DB.mark_cropped(job["game_id"], job["frame_id"])
+    cache.evict()
+
+
+def run_blender(cmd):
+    """Run one Blender process, keeping its timing events and stderr tail."""
+    spawned = time.time()
+    result = subprocess.run(cmd, capture_output=True, text=True, errors="replace")
+    return {
+        "returncode": result.returncode,
+        "events": parse_timing_lines(result.stdout),
+        "stderr_tail": tail(result.stderr),
+        "spawned": spawned,
+        "exited": time.time(),
+    }
+
+
+def stage_times(run, output, first_in_process=True):
+    """Split a Blender run into per-stage seconds for the job writing `output`."""
+    events = run["events"]
+    setup = next((e for e in events if e.get("event") == "setup"), None)
+    place = [e for e in events if e.get("event") == "place" and e.get("output") == output]
+    renders = [e for e in events if e.get("event") == "render" and e.get("output") == output]
+
+    times = {"blender_startup": None, "scene_setup": None, "render": None, "handoff": None, "crop": None}
+    if setup and first_in_process:
+        times["blender_startup"] = setup["script_start"] - run["spawned"]
+    if setup or place:
+        times["scene_setup"] = ((setup["setup"] if setup and first_in_process else 0.0)
+                                + sum(e["place"] for e in place))
+    if renders:
+        times["render"] = sum(e["render"] for e in renders)
+        crops = [e["crop"] for e in renders if e.get("crop") is not None]
+        if crops:
+            times["crop"] = sum(crops)
+        times["handoff"] = max(0.0, run["exited"] - renders[-1]["render_end"])
+    return times
+
+
+def frame_record(job, queued_at=None):
+    return {
+        "game_id": job["game_id"],
+        "frame_id": job["frame_id"],
+        "angle": job["angle"],
+        "queue_wait": (time.time() - queued_at) if queued_at else None,
+        "retries": 0,
+    }
+
+
+def log_frame(record, telemetry=None):
+    if telemetry is not None:
+        telemetry.record(record)
+    if PIPELINE_DB is not None:
+        PIPELINE_DB.record(record)
+
+
+def crop_job(job, record):
+    crop_start = time.perf_counter()
+    ok = finish_job(job)
+    if not IN_BLENDER_CROP:
+        record["crop"] = time.perf_counter() - crop_start
+    return ok
+
+
+def render_job(job, threads, retries=0, backoff=5.0, queued_at=None, attempt_offset=0):
+    """Render and crop one frame in its own Blender process, retrying with backoff."""
+    start = time.time()
+    record = frame_record(job, queued_at)
+    cmd = blender_cmd(
+        "--fen", job["fen"],
+        "--angle", job["angle"],
+        "--output", job["raw_path"],
+        "--threads", str(threads),
+    )
+    # A raw left by an interrupted run must not pass for this render
+    remove_raw_render(job["raw_path"])
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        run = run_blender(cmd)
+        if run["returncode"] == 0 and os.path.exists(job["raw_path"]):
+            break
+
+    record.update(stage_times(run, job["raw_path"]))
+    record["exit_code"] = run["returncode"]
+    record["stderr_tail"] = run["stderr_tail"]
+    record["retries"] = attempt + attempt_offset
+    ok = run["returncode"] == 0 and crop_job(job, record)
+    if run["returncode"] != 0:
+        print(f"\nWarning: Blender failed for game {job['game_id']}, frame {job['frame_id']}")
+    record["ok"] = ok
+    record["total"] = time.time() - start
+    return record
+
+
+def render_parallel(jobs, renders_dir, workers, telemetry=None, retries=0, backoff=5.0, attempt_offset=0):
+    """Run up to `workers` Blender processes at once, cropping as each finishes."""
+    jobs = list(jobs)
+    if not jobs:
+        return
+    os.makedirs(os.path.join(renders_dir, "jobs"), exist_ok=True)
+    for job in jobs:
+        job["raw_path"] = raw_render_path(renders_dir, job)
+
+    threads = threads_per_worker(workers)
+    print(f"Rendering {len(jobs)} frames with {workers} worker(s) ({threads} threads each)")
+
+    queued_at = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(render_job, job, threads, retries, backoff, queued_at, attempt_offset)
+            for job in jobs
+        ]
+        for future in as_completed(futures):
+            log_frame(future.result(), telemetry)
+
+
+def write_manifest(path, jobs):
+    with open(path, "w") as f:
+        for job in jobs:
+            f.write(json.dumps({
+                "fen": job["fen"],
+                "angle": job["angle"],
+                "view": "white",
+                "output": job["raw_path"],
+            }) + "\n")
+
+
+def delta_args():
+    if not DELTA:
+        return []
+    return ["--delta", "--keyframe-every", str(KEYFRAME_EVERY)]
+
+
+def run_manifest(manifest_path, threads):
+    return run_blender(blender_cmd("--manifest", manifest_path, "--threads", str(threads), *delta_args()))
+
+
+def render_batch(jobs, renders_dir, workers=1, telemetry=None, retries=0, backoff=5.0):
+    """Render jobs in long-lived Blender sessions, one JSONL manifest per worker.
+
+    Frames a session failed to produce are retried one process per frame.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return
+
+    os.makedirs(os.path.join(renders_dir, "jobs"), exist_ok=True)
+    for job in jobs:
+        job["raw_path"] = raw_render_path(renders_dir, job)
+        # A raw left by an interrupted run must not pass for this session's output
+        remove_raw_render(job["raw_path"])
+
+    # Contiguous shards keep consecutive frames of a game in the same session
+    workers = max(1, min(workers, len(jobs)))
+    shard_size = (len(jobs) + workers - 1) // workers
+    shards = [jobs[i:i + shard_size] for i in range(0, len(jobs), shard_size)]
+    threads = threads_per_worker(len(shards))
+
+    manifest_paths = []
+    for idx, shard in enumerate(shards):
+        manifest_path = os.path.join(renders_dir, f"manifest_{idx}.jsonl")
+        write_manifest(manifest_path, shard)
+        manifest_paths.append(manifest_path)
+
+    print(f"Rendering {len(jobs)} frames in {len(shards)} Blender session(s) ({threads} threads each)")
+    to_retry = []
+    with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        futures = {pool.submit(run_manifest, path, threads): shard
+                   for path, shard in zip(manifest_paths, shards)}
+        for future in as_completed(futures):
+            run = future.result()
+            for idx, job in enumerate(futures[future]):
+                record = frame_record(job)
+                record.update(stage_times(run, job["raw_path"], first_in_process=(idx == 0)))
+                record["exit_code"] = run["returncode"]
+                record["stderr_tail"] = run["stderr_tail"]
+                # Like render_job: a failed session counts as a failed render for all its frames
+                rendered = run["returncode"] == 0 and os.path.exists(job["raw_path"])
+                if not rendered and retries > 0:
+                    remove_raw_render(job["raw_path"])
+                    to_retry.append(job)
+                    continue
+                if run["returncode"] != 0:
+                    print(f"\nWarning: Blender session failed for game {job['game_id']}, frame {job['frame_id']}")
+                record["ok"] = rendered and crop_job(job, record)
+                log_frame(record, telemetry)
+
+    if to_retry:
+        print(f"\nRetrying {len(to_retry)} frames in separate Blender processes")
+        render_parallel(to_retry, renders_dir, len(shards), telemetry=telemetry,
+                        retries=retries - 1, backoff=backoff, attempt_offset=1)
+
+
+def stub_render(job, seconds=0.0):
+    """Stand-in for Blender when testing the farm: a transparent frame with an opaque board."""
+    time.sleep(seconds)
+    img = np.zeros((400, 400, 4), dtype=np.uint8)
+    seed = sum(ord(c) for c in job["fen"]) % 200
+    img[100:300, 100:300] = (seed, 255 - seed, 128, 255)
+    os.makedirs(os.path.dirname(job["raw_path"]), exist_ok=True)
+    return cv2.imwrite(job["raw_path"], img)
+
+
+def make_farm_render_fn(renders_dir, workers, overwrite=False, stub=False, stub_seconds=0.0, telemetry=None):
+    threads = threads_per_worker(workers)
+
+    def render(job):
+        job["out_path"] = os.path.join(OUTPUT_ROOT, job["out_name"])
+        if not overwrite and os.path.exists(job["out_path"]):
+            return True
+        job["raw_path"] = raw_render_path(renders_dir, job)
+        if stub:
+            start = time.time()
+            record = frame_record(job)
+            record["render"] = stub_seconds
+            record["ok"] = stub_render(job, stub_seconds) and crop_job(job, record)
+            record["total"] = time.time() - start
+        else:
+            # The farm queue owns retries (--max-attempts)
+            record = render_job(job, threads)
+        if telemetry is not None:
+            telemetry.record(record)
+        return record["ok"]
+
+    return render
+
+
+def run_farm(args, games, renders_dir):
+    """Coordinator/worker mode over a shared directory (see render_farm.JobQueue)."""
+    queue = JobQueue(args.farm_dir)
+    if args.role == "coordinator":
+        jobs = []
+        for job in iter_jobs(games, default_angle=args.default_angle, overwrite=args.overwrite):
+            job["job_id"] = f"game_{job['game_id']}_{job['frame_id']}"
+            job["out_name"] = os.path.basename(job.pop("out_path"))
+            jobs.append(job)
+        status = run_coordinator(queue, jobs, stale_seconds=args.stale_after, wait=args.wait)
+    else:
+        telemetry = Telemetry(args.telemetry_log, len(queue.job_ids()))
+        render_fn = make_farm_render_fn(
+            renders_dir, args.workers, overwrite=args.overwrite,
+            stub=args.stub_renderer, stub_seconds=args.stub_seconds, telemetry=telemetry,
+        )
+        run_worker(
+            queue, render_fn,
+            worker_id=args.worker_id or default_worker_id(),
+            heartbeat_seconds=args.heartbeat,
+            stale_seconds=args.stale_after,
+            max_attempts=args.max_attempts,
+            wait=args.wait,
+        )
+        print(telemetry.summary())
+        telemetry.close()
+        status = queue.status()
+    print(f"Farm status: {status}")
+
+
+def recrop_settings_key():
+    """Hash of everything crop_image depends on besides the raw render itself."""
+    blob = json.dumps({"crop_coords": CROP_COORDS, "black_line": BLACK_LINE_PIXELS}, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def recrop(raw_dir, workers=0, overwrite=False):
+    """Re-crop kept raw renders into OUTPUT_ROOT across processes.
+
+    An output is up to date when it is newer than its raw render and border
+    report and the crop settings have not changed since the last re-crop.
+    """
+    if not os.path.isdir(raw_dir):
+        print(f"Error: Raw render folder not found at {raw_dir}")
+        return
+    stamp_path = os.path.join(raw_dir, "recrop_settings.json")
+    settings_key = recrop_settings_key()
+    stamp = None
+    if os.path.exists(stamp_path):
+        with open(stamp_path, "r") as f:
+            stamp = json.load(f).get("key")
+    if stamp is not None and stamp != settings_key:
+        print("Crop settings changed since the last re-crop; redoing every output")
+    force = overwrite or (stamp is not None and stamp != settings_key)
+
+    tasks = []
+    skipped = 0
+    for name in sorted(os.listdir(raw_dir)):
+        match = RAW_NAME_RE.match(name)
+        if not match:
+            continue
+        game_id, frame_id, angle = match.groups()
+        raw_path = os.path.join(raw_dir, name)
+        out_path = os.path.join(OUTPUT_ROOT, f"game_{game_id}_{frame_id}.png")
+        if not force and os.path.exists(out_path):
+            sources = [p for p in (raw_path, border_report_path(raw_path)) if os.path.exists(p)]
+            if os.path.getmtime(out_path) >= max(os.path.getmtime(p) for p in sources):
+                skipped += 1
                 continue
+        tasks.append((raw_path, out_path, angle))
+
+    workers = workers or os.cpu_count() or 1
+    print(f"Re-cropping {len(tasks)} renders with {workers} processes ({skipped} up to date)")
+    os.makedirs(OUTPUT_ROOT, exist_ok=True)
+    start = time.perf_counter()
+    failed = 0
+    if tasks:
+        # One OpenCV thread per process; the pool provides the parallelism
+        with ProcessPoolExecutor(max_workers=workers, initializer=cv2.setNumThreads, initargs=(1,)) as pool:
+            futures = {pool.submit(crop_and_save, *task): task for task in tasks}
+            for future in as_completed(futures):
+                raw_path, out_path, angle = futures[future]
+                if not future.result():
+                    failed += 1
+                    print(f"Warning: Failed to re-crop {raw_path}")
+                    continue
+                if PIPELINE_DB is not None:
+                    # New crop settings: refresh only the crop part of the row's key. The render
+                    # part comes from the raw's sidecar; without one the old key is kept, so a
+                    # mismatch means a re-render rather than a wrongly current row.
+                    game_id, frame_id = RAW_NAME_RE.match(os.path.basename(raw_path)).groups()[:2]
+                    row = PIPELINE_DB.get(game_id, frame_id)
+                    if row is not None:
+                        key = None
+                        if os.path.exists(render_settings_path(raw_path)):
+                            with open(render_settings_path(raw_path), "r") as f:
+                                key = job_cache_key({"fen": row["fen"], "angle": angle}, render=json.load(f))
+                        PIPELINE_DB.mark_cropped(game_id, frame_id, key)
+    print(f"Re-cropped {len(tasks) - failed} renders in {time.perf_counter() - start:.1f}s ({failed} failed)")
+
+    if not failed:
+        with open(stamp_path, "w") as f:
+            json.dump({"key": settings_key}, f)
 
-            generated = find_generated_file(renders_dir, angle)
-            if not generated:
-                print(f"Warning: Render not found for game {game_id}, frame {frame_id}")
+
+def load_rgb(path):
+    img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return None
+    if img.ndim == 3 and img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    if mse == 0:
+        return float("inf")
+    return 10.0 * np.log10(255.0 ** 2 / mse)
+
+
+def ssim(a, b):
+    """Mean SSIM on the luma channel (11x11 Gaussian window, sigma 1.5)."""
+    a = cv2.cvtColor(a, cv2.COLOR_BGR2GRAY).astype(np.float64)
+    b = cv2.cvtColor(b, cv2.COLOR_BGR2GRAY).astype(np.float64)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+
+    def blur(x):
+        return cv2.GaussianBlur(x, (11, 11), 1.5)
+
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a ** 2
+    var_b = blur(b * b) - mu_b ** 2
+    cov = blur(a * b) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+
+def calibrate_profiles(games, count, renders_dir, default_angle=""):
+    """Render a reference set with every profile and score it against "final".
+
+    Each profile runs as one batch session, so seconds/frame includes one
+    amortized Blender startup. Scores are computed on the cropped outputs.
+    """
+    global PROFILE
+    all_jobs = list(iter_jobs(games, default_angle=default_angle, overwrite=True))
+    if not all_jobs:
+        print("Error: No frames available for calibration")
+        return
+    step = max(1, len(all_jobs) // count)
+    reference = all_jobs[::step][:count]
+    print(f"Calibrating {len(RENDER_PROFILES)} profiles on {len(reference)} reference frames")
+
+    timings = {}
+    outputs = {}
+    for name in RENDER_PROFILES:
+        profile_dir = os.path.join(CALIBRATION_DIR, name)
+        os.makedirs(profile_dir, exist_ok=True)
+        jobs = [
+            dict(job, out_path=os.path.join(profile_dir, f"game_{job['game_id']}_{job['frame_id']}.png"))
+            for job in reference
+        ]
+        PROFILE = name
+        start = time.perf_counter()
+        render_batch(jobs, renders_dir)
+        timings[name] = (time.perf_counter() - start) / len(jobs)
+        outputs[name] = [job["out_path"] for job in jobs]
+
+    report = {}
+    for name in RENDER_PROFILES:
+        scores = []
+        for path, ref_path in zip(outputs[name], outputs["final"]):
+            img, ref = load_rgb(path), load_rgb(ref_path)
+            if img is None or ref is None:
                 continue
+            if img.shape != ref.shape:
+                img = cv2.resize(img, (ref.shape[1], ref.shape[0]), interpolation=cv2.INTER_AREA)
+            scores.append((psnr(img, ref), ssim(img, ref)))
+        finite_psnr = [p for p, _ in scores if np.isfinite(p)]
+        report[name] = {
+            "settings": RENDER_PROFILES[name],
+            "seconds_per_frame": timings[name],
+            "frames_scored": len(scores),
+            "psnr": float(np.mean(finite_psnr)) if finite_psnr else float("inf"),
+            "ssim": float(np.mean([v for _, v in scores])) if scores else None,
+        }
+
+    print(f"\n{'profile':<10} {'s/frame':>9} {'PSNR (dB)':>10} {'SSIM':>7}")
+    for name, row in report.items():
+        ssim_str = f"{row['ssim']:.4f}" if row["ssim"] is not None else "n/a"
+        print(f"{name:<10} {row['seconds_per_frame']:>9.1f} {row['psnr']:>10.2f} {ssim_str:>7}")
+
+    report_path = os.path.join(CALIBRATION_DIR, "report.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Calibration report: {report_path}")
+
+
+def main():
+    global USE_PREPARED, PROFILE, TIME_BUDGET, IN_BLENDER_CROP, TARGET_SIZE, PNG_COMPRESSION, DELTA, KEYFRAME_EVERY, KEEP_RAW
+    global PIPELINE_DB
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=str, default="", help="Comma-separated game ids")
+    parser.add_argument("--default-angle", type=str, default="", choices=["", "east", "west", "overhead"])
+    parser.add_argument("--overwrite", action="store_true")
+    parser.add_argument("--batch", action="store_true",
+                        help="Render all frames in a single Blender session (manifest mode)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of concurrent Blender processes (CPU threads are split between them)")
+    parser.add_argument("--prepare", action="store_true",
+                        help="Write the prepared scene snapshot, report startup times and exit")
+    parser.add_argument("--no-prepared", action="store_true",
+                        help="Load the original .blend even if a prepared snapshot exists")
+    parser.add_argument("--profile", type=str, default=PROFILE, choices=sorted(RENDER_PROFILES),
+                        help="Render quality profile")
+    parser.add_argument("--time-budget", type=float, default=0.0,
+                        help="Per-frame render time limit in seconds (0 = unlimited)")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="Render a reference set with every profile and report SSIM/PSNR vs 'final'")
+    parser.add_argument("--calibrate-frames", type=int, default=6,
+                        help="Number of reference frames for --calibrate")
+    parser.add_argument("--in-blender-crop", action="store_true",
+                        help="Crop/trim (and optionally resize) inside Blender and write the final PNG once")
+    parser.add_argument("--target-size", type=int, default=0,
+                        help="With --in-blender-crop: resize the longest side to this many pixels")
+    parser.add_argument("--png-compression", type=int, default=PNG_COMPRESSION,
+                        help="With --in-blender-crop: PNG compression level (0-100)")
+    parser.add_argument("--delta", action="store_true",
+                        help="With --batch: re-render only the squares that changed since the previous frame")
+    parser.add_argument("--keyframe-every", type=int, default=KEYFRAME_EVERY,
+                        help="With --delta: full re-render every N frames (0 = first frame of a session only)")
+    parser.add_argument("--keep-raw", action="store_true",
+                        help=f"Keep each frame's raw render in {os.path.basename(RAW_DIR)}/ for later --recrop runs")
+    parser.add_argument("--recrop", type=str, nargs="?", const=RAW_DIR, default="",
+                        help="Re-crop kept raw renders (default folder: raw_renders/) into the output folder and exit")
+    parser.add_argument("--recrop-workers", type=int, default=0,
+                        help="Processes for --recrop (0 = all cores)")
+    parser.add_argument("--farm-dir", type=str, default="",
+                        help="Shared directory for the multi-host job queue")
+    parser.add_argument("--role", type=str, default="worker", choices=["coordinator", "worker"],
+                        help="With --farm-dir: queue the work list (coordinator) or render jobs (worker)")
+    parser.add_argument("--worker-id", type=str, default="", help="Farm worker name (default host-pid)")
+    parser.add_argument("--wait", action="store_true",
+                        help="Farm: coordinator monitors until done; workers keep polling for new jobs")
+    parser.add_argument("--heartbeat", type=float, default=10.0, help="Farm heartbeat interval (s)")
+    parser.add_argument("--stale-after", type=float, default=120.0,
+                        help="Farm: reclaim claims whose heartbeat is older than this (s)")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Farm: attempts per job before giving up")
+    parser.add_argument("--stub-renderer", action="store_true",
+                        help="Farm worker: write placeholder renders instead of running Blender (testing)")
+    parser.add_argument("--stub-seconds", type=float, default=0.5, help="Simulated render time for --stub-renderer")
+    parser.add_argument("--telemetry-log", type=str, default=TELEMETRY_LOG,
+                        help="Per-frame timing records (JSONL); empty string disables the file")
+    parser.add_argument("--retries", type=int, default=2, help="Retries per failed render")
+    parser.add_argument("--retry-backoff", type=float, default=5.0,
+                        help="Seconds before the first retry; doubles on each further retry")
+    parser.add_argument("--db", type=str, default=PIPELINE_DB_PATH,
+                        help="SQLite pipeline manifest (per-frame parameters, status and timings)")
+    parser.add_argument("--no-db", action="store_true",
+                        help="Skip the pipeline manifest and treat any existing output as done")
+    parser.add_argument("--adopt-existing", action="store_true",
+                        help="Register complete outputs the DB has no row for as done with the current "
+                             "settings (automatic while the DB is empty)")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the content-addressed render cache")
+    parser.add_argument("--cache-max-mb", type=int, default=2048,
+                        help="Render cache size cap in MB (least recently used entries are evicted)")
+    args = parser.parse_args()
+
+    USE_PREPARED = not args.no_prepared
+    PROFILE = args.profile
+    TIME_BUDGET = args.time_budget
+    IN_BLENDER_CROP = args.in_blender_crop
+    TARGET_SIZE = args.target_size
+    PNG_COMPRESSION = args.png_compression
+    DELTA = args.delta
+    KEEP_RAW = args.keep_raw
+    if KEEP_RAW and IN_BLENDER_CROP:
+        print("Warning: --keep-raw has no effect with --in-blender-crop (no raw render is written)")
+    KEYFRAME_EVERY = args.keyframe_every
+    if DELTA and not args.batch:
+        print("Warning: --delta only applies with --batch; rendering full frames")
+        DELTA = False
+    # The farm's shared queue has its own records (and SQLite must not live on a
+    # network share); calibration renders go elsewhere and must not touch frame rows
+    if not args.no_db and not args.farm_dir and not args.calibrate:
+        PIPELINE_DB = PipelineDB(args.db)
+
+    if args.recrop:
+        recrop(args.recrop, workers=args.recrop_workers, overwrite=args.overwrite)
+        return
+
+    if not os.path.exists(BASE_DATA_DIR):
+        print(f"Error: Data folder not found at {BASE_DATA_DIR}")
+        return
+    if not os.path.exists(BLENDER_APP) and not args.stub_renderer:
+        print(f"Error: Blender app not found at {BLENDER_APP}")
+        return
+
+    if args.prepare:
+        prepare_scene()
+        return
+
+    games = parse_games(args.games)
+
+    os.makedirs(OUTPUT_ROOT, exist_ok=True)
+    renders_dir = os.path.join(BLENDER_PROJECT_FOLDER, "renders")
+    os.makedirs(renders_dir, exist_ok=True)
+
+    if args.farm_dir:
+        run_farm(args, games, renders_dir)
+        return
+
+    if args.calibrate:
+        calibrate_profiles(games, args.calibrate_frames, renders_dir, default_angle=args.default_angle)
+        return
+
+    adopt = PIPELINE_DB is not None and (args.adopt_existing or PIPELINE_DB.is_empty())
+    if adopt:
+        print(f"Adopting existing outputs in {OUTPUT_ROOT} into {PIPELINE_DB.path}")
+    jobs = list(iter_jobs(games, default_angle=args.default_angle, overwrite=args.overwrite,
+                          db=PIPELINE_DB, adopt=adopt))
+    cache = None
+    duplicates = []
+    if not args.no_cache:
+        cache = RenderCache(CACHE_DIR, args.cache_max_mb * 1024 * 1024)
+        jobs, duplicates = resolve_from_cache(jobs, cache)
+
+    telemetry = Telemetry(args.telemetry_log, len(jobs))
+    retry = {"retries": args.retries, "backoff": args.retry_backoff}
+    if args.batch:
+        render_batch(jobs, renders_dir, workers=args.workers, telemetry=telemetry, **retry)
+    else:
+        render_parallel(jobs, renders_dir, max(1, args.workers), telemetry=telemetry, **retry)
+    print(telemetry.summary())
+    telemetry.close()
 
-            if not crop_and_save(generated, out_path, angle):
-                print(f"Warning: Failed to crop for game {game_id}, frame {frame_id}")
+    if cache is not None:
+        store_in_cache(jobs, duplicates, cache)
+        print(cache.summary())
+    if PIPELINE_DB is not None:
+        print(PIPELINE_DB.summary())
 
     print(f"Done. Output folder: {OUTPUT_ROOT}")
 
@@ -0,0 +1,141 @@
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# Bump when the stored geometry or layout changes; part of the config hash
+SHARD_FORMAT_VERSION = 1
+SHARDS_FOLDER = "shards"
+
+# Defaults mirror the notebook's CONFIG cell
+IMG_SIZE = 512
+A_CROP_FACTOR = 0.91
+B_CROP_FACTOR = 1.0
+
+
+def shard_config(img_size, crop_a, crop_b):
+    """Everything the stored pixels depend on. The notebook builds the same dict."""
+    return {
+        "version": SHARD_FORMAT_VERSION,
+        "img_size": int(img_size),
+        "crop_A": float(crop_a),
+        "crop_B": float(crop_b),
+        "interpolation": "bicubic",
+        "pad_fill": 0,
+    }
+
+
+def config_hash(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+def shard_dir_name(split, config):
+    return f"{split}_{config_hash(config)}"
+
+
+def center_crop_factor(img, factor):
+    """PIL equivalent of the notebook's center_crop_factor (torchvision center_crop)."""
+    factor = float(factor)
+    if factor >= 1.0:
+        return img
+    w, h = img.size
+    new_w, new_h = int(w * factor), int(h * factor)
+    top = int(round((h - new_h) / 2.0))
+    left = int(round((w - new_w) / 2.0))
+    return img.crop((left, top, left + new_w, top + new_h))
+
+
+def pad_to_square(img, fill=0):
+    w, h = img.size
+    if w == h:
+        return img
+    if w > h:
+        pad_top = (w - h) // 2
+        border = (0, pad_top, 0, (w - h) - pad_top)  # left, top, right, bottom
+    else:
+        pad_left = (h - w) // 2
+        border = (pad_left, 0, (h - w) - pad_left, 0)
+    return ImageOps.expand(img, border=border, fill=fill)
+
+
+def preprocess(path, crop_factor, img_size):
+    """Deterministic part of PairedChessDataset.__getitem__ -> (H, W, 3) uint8."""
+    img = Image.open(path).convert("RGB")
+    img = center_crop_factor(img, crop_factor)
+    img = pad_to_square(img, fill=0)
+    img = img.resize((img_size, img_size), Image.BICUBIC)
+    return np.asarray(img, dtype=np.uint8)
+
+
+def pack_split(pairs, out_dir, config):
+    """Write A.u8/B.u8 memmaps (N, H, W, 3) plus index.json for (name, path_A, path_B) pairs.
+
+    index.json is written last, so a shard directory without it is incomplete.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    index_path = os.path.join(out_dir, "index.json")
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+    size = config["img_size"]
+    shape = (len(pairs), size, size, 3)
+    if pairs:
+        arr_a = np.memmap(os.path.join(out_dir, "A.u8"), dtype=np.uint8, mode="w+", shape=shape)
+        arr_b = np.memmap(os.path.join(out_dir, "B.u8"), dtype=np.uint8, mode="w+", shape=shape)
+        for i, (_, path_a, path_b) in enumerate(pairs):
+            arr_a[i] = preprocess(path_a, config["crop_A"], size)
+            arr_b[i] = preprocess(path_b, config["crop_B"], size)
+        arr_a.flush()
+        arr_b.flush()
+        del arr_a, arr_b
+
+    index = {
+        "config": config,
+        "config_hash": config_hash(config),
+        "shape": list(shape),
+        "rows": {name: i for i, (name, _, _) in enumerate(pairs)},
+    }
+    with open(index_path, "w") as f:
+        json.dump(index, f)
+    return out_dir
+
+
+def pack_dataset(dataset_root, out_root=None, img_size=IMG_SIZE, crop_a_train=A_CROP_FACTOR,
+                 crop_a_val=A_CROP_FACTOR, crop_b=B_CROP_FACTOR):
+    """Pack an extracted {train,val}/{A,B} tree into <out_root>/<split>_<config hash>/."""
+    out_root = out_root or os.path.join(dataset_root, SHARDS_FOLDER)
+    written = []
+    for split, crop_a in (("train", crop_a_train), ("val", crop_a_val)):
+        dir_a = os.path.join(dataset_root, split, "A")
+        dir_b = os.path.join(dataset_root, split, "B")
+        if not os.path.isdir(dir_a):
+            continue
+        pairs = [(name, os.path.join(dir_a, name), os.path.join(dir_b, name))
+                 for name in sorted(os.listdir(dir_a))]
+        config = shard_config(img_size, crop_a, crop_b)
+        out_dir = os.path.join(out_root, shard_dir_name(split, config))
+        pack_split(pairs, out_dir, config)
+        print(f"Packed {split}: {len(pairs)} pairs -> {out_dir}")
+        written.append(out_dir)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dataset_root", help="Folder with train/A, train/B, val/A, val/B")
+    parser.add_argument("--out", type=str, default="", help="Shard root (default: <dataset_root>/shards)")
+    parser.add_argument("--img-size", type=int, default=IMG_SIZE)
+    parser.add_argument("--crop-a-train", type=float, default=A_CROP_FACTOR)
+    parser.add_argument("--crop-a-val", type=float, default=A_CROP_FACTOR)
+    parser.add_argument("--crop-b", type=float, default=B_CROP_FACTOR)
+    args = parser.parse_args()
+
+    pack_dataset(args.dataset_root, args.out or None, args.img_size,
+                 args.crop_a_train, args.crop_a_val, args.crop_b)
+
+
+if __name__ == "__main__":
+    main()
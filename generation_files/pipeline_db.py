@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    game_id        INTEGER NOT NULL,
+    frame_id       TEXT NOT NULL,
+    fen            TEXT NOT NULL,
+    angle          TEXT NOT NULL,
+    params_key     TEXT NOT NULL,
+    out_path       TEXT NOT NULL,
+    status         TEXT NOT NULL DEFAULT 'pending',
+    out_bytes      INTEGER,
+    out_mtime      REAL,
+    paired         INTEGER NOT NULL DEFAULT 0,
+    split          TEXT,
+    render_seconds REAL,
+    crop_seconds   REAL,
+    total_seconds  REAL,
+    attempts       INTEGER NOT NULL DEFAULT 0,
+    error          TEXT,
+    updated_at     REAL NOT NULL,
+    PRIMARY KEY (game_id, frame_id)
+);
+CREATE INDEX IF NOT EXISTS frames_status ON frames (status);
+"""
+
+# pending -> rendered (Blender finished, crop failed) -> cropped; failed on render errors
+STATUSES = ("pending", "rendered", "cropped", "failed")
+
+
+def output_stat(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None, None
+    return st.st_size, st.st_mtime
+
+
+def is_intact(row):
+    """A 'cropped' row whose file still has the recorded size."""
+    return row["status"] == "cropped" and output_stat(row["out_path"])[0] == row["out_bytes"]
+
+
+class PipelineDB:
+    """SQLite record of every (game, frame): FEN, render parameters, stage status and timings.
+
+    params_key hashes the FEN together with every render/crop setting, so a
+    settings change makes the affected rows stale. An output only counts as
+    done when its status is 'cropped', its key matches and the file on disk
+    still has the recorded size (a crash mid-write can't pass for a finished
+    frame).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def get(self, game_id, frame_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM frames WHERE game_id = ? AND frame_id = ?", (int(game_id), str(frame_id))
+            ).fetchone()
+
+    def is_current(self, job):
+        row = self.get(job["game_id"], job["frame_id"])
+        if row is None or row["status"] != "cropped" or row["params_key"] != job["params_key"]:
+            return False
+        size, _ = output_stat(job["out_path"])
+        return size is not None and size == row["out_bytes"]
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM frames").fetchone()[0] == 0
+
+    def register(self, job):
+        """Insert or refresh a job's row; a changed params_key resets its stages."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO frames (game_id, frame_id, fen, angle, params_key, out_path, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (game_id, frame_id) DO UPDATE SET
+                    status = CASE WHEN params_key = excluded.params_key THEN status ELSE 'pending' END,
+                    paired = CASE WHEN params_key = excluded.params_key THEN paired ELSE 0 END,
+                    fen = excluded.fen,
+                    angle = excluded.angle,
+                    params_key = excluded.params_key,
+                    out_path = excluded.out_path,
+                    updated_at = excluded.updated_at
+                """,
+                (int(job["game_id"]), str(job["frame_id"]), job["fen"], job["angle"],
+                 job["params_key"], job["out_path"], time.time()),
+            )
+
+    def record(self, rec):
+        """Store the outcome of one frame from a telemetry record."""
+        if rec.get("ok"):
+            status = "cropped"
+        elif rec.get("exit_code") == 0:
+            status = "rendered"
+        else:
+            status = "failed"
+        key = (int(rec["game_id"]), str(rec["frame_id"]))
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT out_path FROM frames WHERE game_id = ? AND frame_id = ?", key
+            ).fetchone()
+            if row is None:
+                return
+            size, mtime = output_stat(row["out_path"]) if status == "cropped" else (None, None)
+            self._conn.execute(
+                """
+                UPDATE frames SET status = ?, out_bytes = ?, out_mtime = ?, paired = 0,
+                    render_seconds = ?, crop_seconds = ?, total_seconds = ?,
+                    attempts = attempts + 1 + ?, error = ?, updated_at = ?
+                WHERE game_id = ? AND frame_id = ?
+                """,
+                (status, size, mtime, rec.get("render"), rec.get("crop"), rec.get("total"),
+                 rec.get("retries") or 0, None if status == "cropped" else rec.get("stderr_tail"),
+                 time.time(), *key),
+            )
+
+    def mark_cropped(self, game_id, frame_id, params_key=None):
+        """Record an output produced outside a render (cache hit, re-crop)."""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT out_path, params_key FROM frames WHERE game_id = ? AND frame_id = ?",
+                (int(game_id), str(frame_id)),
+            ).fetchone()
+            if row is None:
+                return False
+            size, mtime = output_stat(row["out_path"])
+            if size is None:
+                return False
+            self._conn.execute(
+                """
+                UPDATE frames SET status = 'cropped', params_key = ?, out_bytes = ?, out_mtime = ?,
+                    paired = 0, error = NULL, updated_at = ?
+                WHERE game_id = ? AND frame_id = ?
+                """,
+                (params_key or row["params_key"], size, mtime, time.time(), int(game_id), str(frame_id)),
+            )
+            return True
+
+    def cropped(self):
+        """Finished outputs whose file is still intact, ordered by game and frame."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM frames WHERE status = 'cropped' ORDER BY game_id, frame_id"
+            ).fetchall()
+        return [row for row in rows if is_intact(row)]
+
+    def outputs(self):
+        """Every row keyed by output file name, whatever its status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM frames").fetchall()
+        return {os.path.basename(row["out_path"]): row for row in rows}
+
+    def mark_paired(self, items):
+        """items: iterable of (game_id, frame_id, split)."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE frames SET paired = 1, split = ?, updated_at = ? WHERE game_id = ? AND frame_id = ?",
+                [(split, time.time(), int(g), str(f)) for g, f, split in items],
+            )
+
+    def summary(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM frames GROUP BY status").fetchall())
+            paired = self._conn.execute("SELECT COUNT(*) FROM frames WHERE paired = 1").fetchone()[0]
+        parts = [f"{counts.get(s, 0)} {s}" for s in STATUSES]
+        return f"Pipeline DB: {', '.join(parts)}, {paired} paired ({self.path})"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+
+def normalize_board_fen(fen):
+    """Return the FEN board field with empty-square runs re-compressed."""
+    board = fen.strip().split()[0]
+    ranks = []
+    for rank in board.split("/"):
+        expanded = "".join("1" * int(c) if c.isdigit() else c for c in rank)
+        out = ""
+        run = 0
+        for c in expanded:
+            if c == "1":
+                run += 1
+                continue
+            if run:
+                out += str(run)
+                run = 0
+            out += c
+        if run:
+            out += str(run)
+        ranks.append(out)
+    return "/".join(ranks)
+
+
+def render_key(fen, angle, view, resolution, samples, extra=None):
+    """Content hash of a board position plus every parameter that affects the output."""
+    payload = {
+        "board": normalize_board_fen(fen),
+        "angle": angle,
+        "view": view,
+        "resolution": resolution,
+        "samples": samples,
+        "extra": extra or {},
+    }
+    blob = json.dumps(payload, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()
+
+
+def link_or_copy(src, dst):
+    """Hardlink src to dst, falling back to a copy across filesystems."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Copy under a temp name so dst is never a partial file
+        tmp_path = f"{dst}.tmp{os.getpid()}"
+        shutil.copy2(src, tmp_path)
+        os.replace(tmp_path, dst)
+
+
+class RenderCache:
+    """Content-addressed store of cropped renders with a size cap and LRU eviction.
+
+    Entries live at <root>/<key[:2]>/<key>.png. Recency is tracked through the
+    mtime of an empty <key>.used sidecar, refreshed on every hit. The entry
+    itself is hardlinked to outputs, so touching it would change their mtimes.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        os.makedirs(root, exist_ok=True)
+
+    def entry_path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.png")
+
+    @staticmethod
+    def used_path(entry_path):
+        return os.path.splitext(entry_path)[0] + ".used"
+
+    def touch(self, entry_path):
+        used = self.used_path(entry_path)
+        with open(used, "a"):
+            pass
+        os.utime(used)
+
+    def fetch(self, key, dst):
+        """Materialize a cached entry at dst. Returns True on a hit."""
+        path = self.entry_path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return False
+        link_or_copy(path, dst)
+        self.touch(path)
+        self.hits += 1
+        return True
+
+    def store(self, key, src):
+        if not os.path.exists(src):
+            return False
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique temp name: orchestrators storing the same key at once must not share it
+        tmp_path = f"{path}.tmp.{os.getpid()}.{uuid.uuid4().hex}"
+        try:
+            link_or_copy(src, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+        self.touch(path)
+        self.stores += 1
+        return True
+
+    def entries(self):
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith(".png"):
+                    continue
+                path = os.path.join(dirpath, name)
+                size = os.stat(path).st_size
+                try:
+                    used = os.stat(self.used_path(path)).st_mtime
+                except FileNotFoundError:
+                    used = 0.0  # entries from before sidecars: oldest first
+                found.append((used, size, path))
+        return found
+
+    def evict(self):
+        """Drop least-recently-used entries until the cache fits in max_bytes."""
+        if self.max_bytes <= 0:
+            return
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            if os.path.exists(self.used_path(path)):
+                os.remove(self.used_path(path))
+            total -= size
+            self.evictions += 1
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        rate = (100.0 * self.hits / lookups) if lookups else 0.0
+        return (
+            f"Render cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), "
+            f"{self.stores} stored, {self.evictions} evicted"
+        )
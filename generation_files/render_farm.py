@@ -0,0 +1,288 @@
+import json
+import os
+import socket
+import threading
+import time
+
+
+def atomic_write_json(path, data):
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class JobQueue:
+    """Render job queue on a shared directory (NFS/SMB/local).
+
+    Layout under root:
+      jobs/<id>.json     job spec, written by the coordinator
+      claims/<id>.lock   created with O_EXCL by the worker that owns the job and
+                         holding its id; its mtime is the worker's heartbeat
+      done/<id>.json     completion record
+      failed/<id>.json   jobs that ran out of attempts
+
+    Any number of workers can join or leave at any time; a claim whose
+    heartbeat is older than the stale timeout is reclaimed by whoever sees it.
+    Heartbeats, completions and releases that pass a worker_id only act while
+    that worker still owns the claim, so a reclaimed worker that finishes late
+    never drops the lock of the worker that took the job over.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.jobs_dir = os.path.join(root, "jobs")
+        self.claims_dir = os.path.join(root, "claims")
+        self.done_dir = os.path.join(root, "done")
+        self.failed_dir = os.path.join(root, "failed")
+        for d in (self.jobs_dir, self.claims_dir, self.done_dir, self.failed_dir):
+            os.makedirs(d, exist_ok=True)
+
+    def job_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def claim_path(self, job_id):
+        return os.path.join(self.claims_dir, f"{job_id}.lock")
+
+    def done_path(self, job_id):
+        return os.path.join(self.done_dir, f"{job_id}.json")
+
+    def failed_path(self, job_id):
+        return os.path.join(self.failed_dir, f"{job_id}.json")
+
+    def job_ids(self):
+        return sorted(name[:-5] for name in os.listdir(self.jobs_dir) if name.endswith(".json"))
+
+    def is_finished(self, job_id):
+        return os.path.exists(self.done_path(job_id)) or os.path.exists(self.failed_path(job_id))
+
+    def submit(self, jobs):
+        """Add jobs that are not queued or finished yet. Returns the number added."""
+        added = 0
+        for job in jobs:
+            job_id = job["job_id"]
+            if os.path.exists(self.job_path(job_id)) or self.is_finished(job_id):
+                continue
+            atomic_write_json(self.job_path(job_id), dict(job, attempts=0))
+            added += 1
+        return added
+
+    def try_claim(self, job_id, worker_id):
+        try:
+            fd = os.open(self.claim_path(job_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(worker_id)
+        # Finished between listing and claiming
+        if self.is_finished(job_id):
+            self.release(job_id, worker_id)
+            return False
+        return True
+
+    def claim_next(self, worker_id):
+        """Claim the first unfinished, unclaimed job. Returns its spec or None."""
+        for job_id in self.job_ids():
+            if self.is_finished(job_id) or os.path.exists(self.claim_path(job_id)):
+                continue
+            if self.try_claim(job_id, worker_id):
+                job = read_json(self.job_path(job_id))
+                if job is None:
+                    self.release(job_id, worker_id)
+                    continue
+                return job
+        return None
+
+    def owner(self, job_id):
+        """Worker id stored in a job's claim, or None if it is unclaimed."""
+        try:
+            with open(self.claim_path(job_id), "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def owns(self, job_id, worker_id):
+        return worker_id is None or self.owner(job_id) == worker_id
+
+    def heartbeat(self, job_id, worker_id=None):
+        if not self.owns(job_id, worker_id):
+            return
+        try:
+            os.utime(self.claim_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def release(self, job_id, worker_id=None):
+        """Remove a claim; with worker_id, only if that worker still owns it."""
+        if not self.owns(job_id, worker_id):
+            return False
+        try:
+            os.remove(self.claim_path(job_id))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def complete(self, job_id, record, worker_id=None):
+        """Write the done record. False if worker_id lost the claim (another worker has the job)."""
+        if not self.owns(job_id, worker_id):
+            return False
+        atomic_write_json(self.done_path(job_id), record)
+        self.release(job_id, worker_id)
+        return True
+
+    def fail(self, job_id, error, max_attempts, worker_id=None):
+        """Record a failed attempt; the job is retried until max_attempts."""
+        if not self.owns(job_id, worker_id):
+            return False
+        job = read_json(self.job_path(job_id)) or {"job_id": job_id, "attempts": 0}
+        job["attempts"] = int(job.get("attempts", 0)) + 1
+        job["last_error"] = error
+        if job["attempts"] >= max_attempts:
+            atomic_write_json(self.failed_path(job_id), job)
+        else:
+            atomic_write_json(self.job_path(job_id), job)
+        self.release(job_id, worker_id)
+        return True
+
+    def reclaim_stale(self, stale_seconds):
+        """Drop claims whose heartbeat is older than stale_seconds. Returns their ids."""
+        reclaimed = []
+        now = time.time()
+        for name in os.listdir(self.claims_dir):
+            if not name.endswith(".lock"):
+                continue
+            path = os.path.join(self.claims_dir, name)
+            try:
+                if now - os.path.getmtime(path) < stale_seconds:
+                    continue
+                # Rename first so only one process reclaims a given claim
+                grave = f"{path}.stale.{os.getpid()}"
+                os.rename(path, grave)
+            except FileNotFoundError:
+                continue
+            if time.time() - os.path.getmtime(grave) < stale_seconds:
+                # Raced with a fresh claim; put it back if nobody replaced it
+                if not os.path.exists(path):
+                    os.rename(grave, path)
+                    continue
+            os.remove(grave)
+            reclaimed.append(name[:-5])
+        return reclaimed
+
+    def status(self):
+        job_ids = self.job_ids()
+        done = sum(1 for j in job_ids if os.path.exists(self.done_path(j)))
+        failed = sum(1 for j in job_ids if os.path.exists(self.failed_path(j)))
+        claimed = sum(1 for j in job_ids
+                      if os.path.exists(self.claim_path(j)) and not self.is_finished(j))
+        return {
+            "total": len(job_ids),
+            "done": done,
+            "failed": failed,
+            "running": claimed,
+            "pending": len(job_ids) - done - failed - claimed,
+        }
+
+
+class Heartbeat:
+    """Context manager that touches a job's claim file in the background."""
+
+    def __init__(self, queue, job_id, interval, worker_id=None):
+        self.queue = queue
+        self.job_id = job_id
+        self.interval = interval
+        self.worker_id = worker_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.queue.heartbeat(self.job_id, self.worker_id)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def run_worker(queue, render_fn, worker_id=None, heartbeat_seconds=10.0, stale_seconds=60.0,
+               max_attempts=3, poll_seconds=5.0, wait=False):
+    """Claim and render jobs until the queue is drained.
+
+    render_fn(job) -> bool renders one job and writes its final output.
+    With wait=True the worker keeps polling for newly submitted jobs.
+    """
+    worker_id = worker_id or default_worker_id()
+    rendered = 0
+    print(f"Worker {worker_id} started on {queue.root}")
+    while True:
+        for job_id in queue.reclaim_stale(stale_seconds):
+            print(f"Reclaimed stale job {job_id}")
+
+        job = queue.claim_next(worker_id)
+        if job is None:
+            status = queue.status()
+            if not wait and status["pending"] == 0 and status["running"] == 0:
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        job_id = job["job_id"]
+        start = time.time()
+        try:
+            with Heartbeat(queue, job_id, heartbeat_seconds, worker_id):
+                ok = render_fn(job)
+        except Exception as e:
+            ok = False
+            print(f"Warning: Job {job_id} raised {e}")
+
+        record = {
+            "job_id": job_id,
+            "worker": worker_id,
+            "seconds": time.time() - start,
+            "finished_at": time.time(),
+        }
+        # complete/fail return False if the claim was reclaimed as stale while rendering;
+        # the worker that took the job over reports it
+        if ok and queue.complete(job_id, record, worker_id):
+            rendered += 1
+            print(f"Worker {worker_id}: done {job_id}")
+        elif not ok and queue.fail(job_id, f"render failed on {worker_id}", max_attempts, worker_id):
+            print(f"Warning: Worker {worker_id}: job {job_id} failed")
+        else:
+            print(f"Warning: Worker {worker_id}: lost the claim on {job_id}; result discarded")
+
+    print(f"Worker {worker_id} finished ({rendered} jobs rendered)")
+    return rendered
+
+
+def run_coordinator(queue, jobs, stale_seconds=60.0, poll_seconds=10.0, wait=True):
+    """Submit the work list, then reclaim stale claims and report progress until done."""
+    added = queue.submit(jobs)
+    print(f"Coordinator: queued {added} new jobs in {queue.root}")
+    while wait:
+        for job_id in queue.reclaim_stale(stale_seconds):
+            print(f"Coordinator: reclaimed stale job {job_id}")
+        status = queue.status()
+        print(f"Coordinator: {status['done']}/{status['total']} done, {status['running']} running, "
+              f"{status['pending']} pending, {status['failed']} failed")
+        if status["pending"] == 0 and status["running"] == 0:
+            break
+        time.sleep(poll_seconds)
+    return queue.status()
@@ -0,0 +1,93 @@
+import json
+import sys
+import threading
+import time
+
+TIMING_PREFIX = "CHESS_TIMING "
+STAGES = ("queue_wait", "blender_startup", "scene_setup", "render", "handoff", "crop", "total")
+
+
+def parse_timing_lines(stdout):
+    """Extract the CHESS_TIMING events printed by the Blender script."""
+    events = []
+    for line in (stdout or "").splitlines():
+        if not line.startswith(TIMING_PREFIX):
+            continue
+        try:
+            events.append(json.loads(line[len(TIMING_PREFIX):]))
+        except ValueError:
+            continue
+    return events
+
+
+def tail(text, lines=20):
+    return "\n".join((text or "").splitlines()[-lines:])
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(q / 100.0 * (len(values) - 1)))))
+    return values[idx]
+
+
+def format_duration(seconds):
+    seconds = int(max(0, seconds))
+    return f"{seconds // 3600:d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class Telemetry:
+    """Per-frame JSONL records, a live progress line and an end-of-run summary."""
+
+    def __init__(self, path, total):
+        self.path = path
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.records = []
+        self.start = time.time()
+        self._lock = threading.Lock()
+        self._file = open(path, "a") if path else None
+
+    def record(self, rec):
+        with self._lock:
+            self.records.append(rec)
+            if rec.get("ok"):
+                self.done += 1
+            else:
+                self.failed += 1
+            if self._file:
+                self._file.write(json.dumps(rec) + "\n")
+                self._file.flush()
+            self._progress()
+
+    def _progress(self):
+        finished = self.done + self.failed
+        elapsed = max(time.time() - self.start, 1e-6)
+        per_hour = self.done * 3600.0 / elapsed
+        remaining = self.total - finished
+        eta = remaining * elapsed / finished if finished else 0.0
+        sys.stdout.write(
+            f"\r[{finished}/{self.total}] {self.done} ok, {self.failed} failed | "
+            f"{per_hour:.1f} frames/h | ETA {format_duration(eta)}   "
+        )
+        sys.stdout.flush()
+
+    def summary(self):
+        if self.records:
+            print()
+        lines = [f"{'stage':<16} {'p50 (s)':>9} {'p95 (s)':>9}"]
+        for stage in STAGES:
+            values = [r[stage] for r in self.records if r.get(stage) is not None]
+            if not values:
+                continue
+            lines.append(f"{stage:<16} {percentile(values, 50):>9.2f} {percentile(values, 95):>9.2f}")
+        retried = sum(1 for r in self.records if r.get("retries"))
+        lines.append(f"frames: {self.done} ok, {self.failed} failed, {retried} needed retries")
+        return "\n".join(lines)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
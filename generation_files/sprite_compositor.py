@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import subprocess
+import time
+
+import cv2
+import numpy as np
+
+from generate_full_generation_without_hands import (
+    BLENDER_APP,
+    CURRENT_DIR,
+    GAME_CONFIG,
+    blender_cmd,
+    crop_and_save,
+    crop_image,
+    iter_jobs,
+    load_rgb,
+    parse_games,
+    psnr,
+    remove_raw_render,
+    ssim,
+    write_output,
+)
+
+SPRITES_DIR = os.path.join(CURRENT_DIR, "sprites")
+# Composites get their own root so they never mix with (or pass for) the Cycles renders
+SPRITE_OUTPUT_ROOT = os.path.join(CURRENT_DIR, "full_generation_sprites")
+VALIDATION_DIR = os.path.join(CURRENT_DIR, "sprite_validation")
+
+
+def parse_board(fen):
+    """FEN board field -> {square: piece_char}"""
+    position = {}
+    for rank_idx, rank in enumerate(fen.split()[0].split("/")):
+        file_idx = 0
+        for char in rank:
+            if char.isdigit():
+                file_idx += int(char)
+            else:
+                position[f"{chr(ord('a') + file_idx)}{8 - rank_idx}"] = char
+                file_idx += 1
+    return position
+
+
+def to_rgba(img):
+    if img.shape[2] == 3:
+        alpha = np.full(img.shape[:2] + (1,), 255, dtype=img.dtype)
+        img = np.concatenate([img, alpha], axis=2)
+    return img
+
+
+class SpriteAtlas:
+    """Baked layers for one angle. Piece layers are trimmed to their alpha bbox."""
+
+    def __init__(self, sprite_dir):
+        self.dir = sprite_dir
+        with open(os.path.join(sprite_dir, "sprites.json"), "r") as f:
+            self.meta = json.load(f)
+        board = cv2.imread(os.path.join(sprite_dir, self.meta["board"]), cv2.IMREAD_UNCHANGED)
+        if board is None:
+            raise FileNotFoundError(f"Board layer missing in {sprite_dir}")
+        self.board = to_rgba(board)
+        self.depth = self.meta["depth"]
+        self._sprites = {}
+
+    @property
+    def angle(self):
+        return self.meta["angle"]
+
+    @property
+    def border(self):
+        return self.meta.get("border")
+
+    def sprite(self, piece, square):
+        """(y, x, uint8 RGBA tile) for a piece on a square, or None if not baked."""
+        key = f"{piece}{square}"
+        if key not in self._sprites:
+            name = self.meta["layers"].get(key)
+            img = cv2.imread(os.path.join(self.dir, name), cv2.IMREAD_UNCHANGED) if name else None
+            if img is None:
+                self._sprites[key] = None
+            else:
+                img = to_rgba(img)
+                alpha = img[:, :, 3] > 0
+                rows = np.flatnonzero(alpha.any(axis=1))
+                cols = np.flatnonzero(alpha.any(axis=0))
+                if not rows.size:
+                    self._sprites[key] = None
+                else:
+                    y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+                    self._sprites[key] = (y0, x0, np.ascontiguousarray(img[y0:y1, x0:x1]))
+        return self._sprites[key]
+
+    def composite(self, fen):
+        """Raw (uncropped) RGBA uint8 frame for a FEN, pieces drawn far to near."""
+        out = self.board.astype(np.float32) / 255.0
+        position = parse_board(fen)
+        for square in sorted(position, key=lambda sq: -self.depth[sq]):
+            sprite = self.sprite(position[square], square)
+            if sprite is None:
+                print(f"Warning: No sprite for {position[square]} on {square}")
+                continue
+            y, x, tile = sprite
+            tile = tile.astype(np.float32) / 255.0
+            region = out[y:y + tile.shape[0], x:x + tile.shape[1]]
+
+            # Straight-alpha "over"
+            src_a = tile[:, :, 3:4]
+            dst_a = region[:, :, 3:4]
+            out_a = src_a + dst_a * (1.0 - src_a)
+            rgb = tile[:, :, :3] * src_a + region[:, :, :3] * dst_a * (1.0 - src_a)
+            region[:, :, :3] = np.where(out_a > 0, rgb / np.maximum(out_a, 1e-6), 0.0)
+            region[:, :, 3:4] = out_a
+        return (out * 255.0 + 0.5).astype(np.uint8)
+
+    def render(self, fen):
+        """Composited frame with the same crop geometry as crop_and_save."""
+        return crop_image(self.composite(fen), self.angle, self.border)
+
+
+def load_atlases():
+    atlases = {}
+    for angle in sorted(set(GAME_CONFIG.values())):
+        sprite_dir = os.path.join(SPRITES_DIR, angle)
+        if os.path.exists(os.path.join(sprite_dir, "sprites.json")):
+            atlases[angle] = SpriteAtlas(sprite_dir)
+    return atlases
+
+
+def bake(angles):
+    if not os.path.exists(BLENDER_APP):
+        print(f"Error: Blender app not found at {BLENDER_APP}")
+        return
+    for angle in angles:
+        sprite_dir = os.path.join(SPRITES_DIR, angle)
+        print(f"Baking sprites for {angle} -> {sprite_dir}")
+        result = subprocess.run(blender_cmd("--bake-sprites", sprite_dir, "--angle", angle))
+        if result.returncode != 0:
+            print(f"Warning: Sprite bake failed for {angle}")
+
+
+def generate(games, overwrite=False, out_root=SPRITE_OUTPUT_ROOT):
+    atlases = load_atlases()
+    os.makedirs(out_root, exist_ok=True)
+    written = 0
+    elapsed = 0.0
+    # overwrite=True: iter_jobs would otherwise check the Cycles outputs, not ours
+    for job in iter_jobs(games, overwrite=True):
+        out_path = os.path.join(out_root, os.path.basename(job["out_path"]))
+        if not overwrite and os.path.exists(out_path):
+            continue
+        atlas = atlases.get(job["angle"])
+        if atlas is None:
+            print(f"Warning: No sprites baked for angle {job['angle']}")
+            continue
+        start = time.perf_counter()
+        img = atlas.render(job["fen"])
+        elapsed += time.perf_counter() - start
+        if img is None:
+            print(f"Warning: Failed to crop game {job['game_id']}, frame {job['frame_id']}")
+            continue
+        if not write_output(out_path, img):
+            print(f"Warning: Failed to write {out_path}")
+            continue
+        written += 1
+    if written:
+        print(f"Composited {written} frames ({1000.0 * elapsed / written:.1f} ms/frame)")
+    print(f"Done. Output folder: {out_root}")
+
+
+def render_reference(job, ref_dir):
+    """Fresh Cycles render of a job's position, cropped like the main pipeline."""
+    name = os.path.basename(job["out_path"])
+    raw_path = os.path.join(ref_dir, f"raw_{name}")
+    ref_path = os.path.join(ref_dir, name)
+    remove_raw_render(raw_path)
+    result = subprocess.run(blender_cmd("--fen", job["fen"], "--angle", job["angle"], "--output", raw_path))
+    ok = result.returncode == 0 and crop_and_save(raw_path, ref_path, job["angle"])
+    remove_raw_render(raw_path)
+    return ref_path if ok else None
+
+
+def validate(games, samples, reference_dir=""):
+    """Compare composited frames with Cycles renders of the same positions.
+
+    References are rendered fresh into VALIDATION_DIR/cycles, unless
+    reference_dir names a folder known to hold only Cycles outputs.
+    """
+    if not reference_dir and not os.path.exists(BLENDER_APP):
+        print(f"Error: Blender app not found at {BLENDER_APP} (or pass --reference-dir)")
+        return
+    atlases = load_atlases()
+    candidates = [job for job in iter_jobs(games, overwrite=True) if job["angle"] in atlases]
+    if reference_dir:
+        candidates = [job for job in candidates
+                      if os.path.exists(os.path.join(reference_dir, os.path.basename(job["out_path"])))]
+    if not candidates:
+        print("Error: No frames with baked sprites (and a reference render) to compare")
+        return
+    step = max(1, len(candidates) // samples)
+    sample = candidates[::step][:samples]
+
+    os.makedirs(VALIDATION_DIR, exist_ok=True)
+    cycles_dir = os.path.join(VALIDATION_DIR, "cycles")
+    os.makedirs(cycles_dir, exist_ok=True)
+    rows = []
+    for job in sample:
+        if reference_dir:
+            ref_path = os.path.join(reference_dir, os.path.basename(job["out_path"]))
+        else:
+            ref_path = render_reference(job, cycles_dir)
+            if ref_path is None:
+                print(f"Warning: Reference render failed for game {job['game_id']}, frame {job['frame_id']}")
+                continue
+        real = load_rgb(ref_path)
+        fake = atlases[job["angle"]].render(job["fen"])
+        if real is None or fake is None:
+            continue
+        fake = cv2.cvtColor(fake, cv2.COLOR_BGRA2BGR)
+        if fake.shape != real.shape:
+            fake = cv2.resize(fake, (real.shape[1], real.shape[0]), interpolation=cv2.INTER_AREA)
+        name = os.path.basename(job["out_path"])
+        cv2.imwrite(os.path.join(VALIDATION_DIR, name), np.concatenate([real, fake], axis=1))
+        rows.append((name, psnr(fake, real), ssim(fake, real)))
+
+    print(f"\n{'frame':<24} {'PSNR (dB)':>10} {'SSIM':>7}")
+    for name, p, s in rows:
+        print(f"{name:<24} {p:>10.2f} {s:>7.4f}")
+    if rows:
+        finite = [p for _, p, _ in rows if np.isfinite(p)]
+        mean_psnr = np.mean(finite) if finite else float("inf")
+        print(f"{'mean':<24} {mean_psnr:>10.2f} {np.mean([s for _, _, s in rows]):>7.4f}")
+    print(f"Side-by-side (real | composited): {VALIDATION_DIR}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_bake = sub.add_parser("bake", help="Render sprite layers in Blender (one-time)")
+    p_bake.add_argument("--angles", type=str, default="east,west,overhead")
+
+    p_gen = sub.add_parser("generate", help="Composite every CSV frame into full_generation_sprites/")
+    p_gen.add_argument("--games", type=str, default="", help="Comma-separated game ids")
+    p_gen.add_argument("--overwrite", action="store_true")
+    p_gen.add_argument("--out", type=str, default=SPRITE_OUTPUT_ROOT, help="Output folder for composites")
+
+    p_val = sub.add_parser("validate", help="Compare composites with existing Cycles renders")
+    p_val.add_argument("--games", type=str, default="", help="Comma-separated game ids")
+    p_val.add_argument("--samples", type=int, default=12)
+    p_val.add_argument("--reference-dir", type=str, default="",
+                       help="Folder of Cycles-only outputs to compare against (default: render fresh references)")
+
+    args = parser.parse_args()
+    if args.command == "bake":
+        bake([a.strip() for a in args.angles.split(",") if a.strip()])
+    elif args.command == "generate":
+        generate(parse_games(args.games), overwrite=args.overwrite, out_root=args.out)
+    else:
+        validate(parse_games(args.games), args.samples, args.reference_dir)
+
+
+if __name__ == "__main__":
+    main()
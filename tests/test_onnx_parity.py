@@ -0,0 +1,139 @@
+import inspect
+import json
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "colab_files"))
+import onnx_generator  # noqa: E402
+
+nn = torch.nn
+IMG_SIZE = 64
+ATOL = 1e-4
+
+
+class TinyGenerator(nn.Module):
+    """Two-level version of the notebook's GeneratorUNet: same layer types, skip concat and tanh."""
+
+    def __init__(self):
+        super().__init__()
+        self.d1 = nn.Conv2d(3, 8, 4, 2, 1)
+        self.d2 = nn.Sequential(nn.Conv2d(8, 16, 4, 2, 1, bias=False), nn.BatchNorm2d(16), nn.LeakyReLU(0.2))
+        self.u1 = nn.Sequential(nn.ConvTranspose2d(16, 8, 4, 2, 1, bias=False), nn.BatchNorm2d(8), nn.ReLU(),
+                                nn.Dropout(0.5))
+        self.final = nn.Sequential(nn.ConvTranspose2d(16, 3, 4, 2, 1), nn.Tanh())
+
+    def forward(self, x):
+        d1 = self.d1(x)
+        u1 = self.u1(self.d2(d1))
+        return self.final(torch.cat((u1, d1), dim=1))
+
+
+def contract():
+    # Same keys as the notebook's onnx_contract()
+    return {
+        "img_size": IMG_SIZE,
+        "a_crop_factor": 0.91,
+        "pad_fill": 0,
+        "resize": "bicubic",
+        "input": "RGB, NCHW float32, (x/255 - 0.5) * 2",
+        "output": "RGB, NCHW float32, tanh in [-1, 1]",
+        "source": "random",
+    }
+
+
+def export_onnx(model, onnx_path):
+    """Mirror of the notebook's export_onnx (section 8.1)."""
+    import onnx
+
+    example = torch.randn(1, 3, IMG_SIZE, IMG_SIZE, generator=torch.Generator().manual_seed(0))
+    kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            model, example, onnx_path, opset_version=17,
+            input_names=["input"], output_names=["output"],
+            dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}}, **kwargs,
+        )
+    proto = onnx.load(onnx_path)
+    for key, value in contract().items():
+        entry = proto.metadata_props.add()
+        entry.key, entry.value = key, json.dumps(value)
+    onnx.checker.check_model(proto)
+    onnx.save(proto, onnx_path)
+
+
+@pytest.fixture(scope="module")
+def exported(tmp_path_factory):
+    torch.manual_seed(0)
+    model = TinyGenerator()
+    # Non-trivial BatchNorm statistics, then inference mode (dropout off)
+    model.train()
+    with torch.no_grad():
+        model(torch.randn(8, 3, IMG_SIZE, IMG_SIZE))
+    model.eval()
+    path = str(tmp_path_factory.mktemp("onnx") / "generator.onnx")
+    export_onnx(model, path)
+    return model, onnx_generator.make_session(path)
+
+
+def test_contract_round_trips(exported):
+    _, session = exported
+    assert onnx_generator.load_contract(session) == contract()
+
+
+def test_random_batch_matches_pytorch(exported):
+    model, session = exported
+    x = torch.randn(3, 3, IMG_SIZE, IMG_SIZE, generator=torch.Generator().manual_seed(1))
+    with torch.no_grad():
+        ref = model(x).numpy()
+    out = session.run(None, {"input": x.numpy()})[0]
+    assert out.shape == ref.shape
+    np.testing.assert_allclose(out, ref, atol=ATOL, rtol=0)
+
+
+def test_preprocessed_images_match_pytorch(exported, tmp_path):
+    model, session = exported
+    rng = np.random.default_rng(2)
+    paths = []
+    for i, (w, h) in enumerate(((97, 80), (70, 110))):
+        path = str(tmp_path / f"img_{i}.png")
+        Image.fromarray(rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8)).save(path)
+        paths.append(path)
+
+    x = np.stack([onnx_generator.preprocess(p, contract()) for p in paths])
+    assert x.shape == (2, 3, IMG_SIZE, IMG_SIZE) and x.dtype == np.float32
+    assert x.min() >= -1.0 and x.max() <= 1.0
+    with torch.no_grad():
+        ref = model(torch.from_numpy(x)).numpy()
+    np.testing.assert_allclose(session.run(None, {"input": x})[0], ref, atol=ATOL, rtol=0)
+
+    out_dir = str(tmp_path / "out")
+    written = onnx_generator.infer(session, paths, out_dir, batch_size=2, outputs=("fake",), writers=1)
+    assert sorted(os.path.basename(p) for p in written) == ["img_0_fake.png", "img_1_fake.png"]
+    assert Image.open(written[0]).size == (IMG_SIZE, IMG_SIZE)
+
+
+def test_preprocess_matches_notebook_transforms(tmp_path):
+    """onnx_generator.preprocess vs the notebook's torchvision steps (center crop, pad, bicubic resize)."""
+    TF = pytest.importorskip("torchvision.transforms.functional")
+    from torchvision.transforms import InterpolationMode
+
+    path = str(tmp_path / "img.png")
+    img = Image.fromarray(np.random.default_rng(3).integers(0, 256, size=(90, 120, 3), dtype=np.uint8))
+    img.save(path)
+
+    w, h = img.size
+    ref = TF.center_crop(img, [int(h * 0.91), int(w * 0.91)])
+    w, h = ref.size
+    pad_top = (w - h) // 2
+    ref = TF.pad(ref, (0, pad_top, 0, (w - h) - pad_top), fill=0)
+    ref = TF.resize(ref, (IMG_SIZE, IMG_SIZE), interpolation=InterpolationMode.BICUBIC)
+    ref = ((TF.to_tensor(ref) - 0.5) * 2.0).numpy()
+    np.testing.assert_allclose(onnx_generator.preprocess(path, contract()), ref, atol=1e-6, rtol=0)
@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "generation_files"))
+from render_farm import JobQueue, read_json, run_coordinator, run_worker  # noqa: E402
+
+STALE_SECONDS = 0.5
+
+
+def stub_render(job):
+    """Stand-in renderer: logs the attempt, and stalls past the stale timeout on a slow job's first attempt."""
+    root = job["root"]
+    with open(os.path.join(root, "renders.log"), "a") as f:
+        f.write(f"{job['job_id']} {os.getpid()}\n")
+    if job.get("slow"):
+        try:
+            os.close(os.open(os.path.join(root, f"{job['job_id']}.stalled"), os.O_CREAT | os.O_EXCL))
+            time.sleep(4 * STALE_SECONDS)
+        except FileExistsError:
+            pass
+    time.sleep(0.01)
+    return True
+
+
+def worker_main(args):
+    root, worker_id = args
+    # Heartbeats slower than the stale timeout, so a stalled render gets reclaimed
+    return run_worker(JobQueue(root), stub_render, worker_id=worker_id, heartbeat_seconds=60.0,
+                      stale_seconds=STALE_SECONDS, poll_seconds=0.05)
+
+
+def make_jobs(root, count, slow=()):
+    return [{"job_id": f"game_1_{i}", "root": root, "slow": i in slow} for i in range(count)]
+
+
+def run_farm(root, jobs, workers):
+    queue = JobQueue(root)
+    run_coordinator(queue, jobs, wait=False)
+    try:
+        ctx = multiprocessing.get_context("fork")
+    except ValueError:
+        pytest.skip("needs the fork start method")
+    with ctx.Pool(workers) as pool:
+        rendered = pool.map(worker_main, [(root, f"w{i}") for i in range(workers)])
+    return queue, rendered
+
+
+def test_stub_workers_complete_every_job_once(tmp_path):
+    root = str(tmp_path)
+    jobs = make_jobs(root, 40)
+    queue, rendered = run_farm(root, jobs, workers=4)
+
+    assert queue.status() == {"total": 40, "done": 40, "failed": 0, "running": 0, "pending": 0}
+    assert sum(rendered) == 40
+    with open(os.path.join(root, "renders.log")) as f:
+        attempts = [line.split()[0] for line in f]
+    assert sorted(attempts) == sorted(job["job_id"] for job in jobs)
+    assert os.listdir(queue.claims_dir) == []
+
+
+def test_stalled_worker_is_reclaimed_and_its_late_result_discarded(tmp_path):
+    root = str(tmp_path)
+    jobs = make_jobs(root, 12, slow={3})
+    queue, rendered = run_farm(root, jobs, workers=3)
+
+    assert queue.status() == {"total": 12, "done": 12, "failed": 0, "running": 0, "pending": 0}
+    # The stalled worker's late finish must not count: one completion per job
+    assert sum(rendered) == 12
+    with open(os.path.join(root, "renders.log")) as f:
+        slow_attempts = [line.split()[1] for line in f if line.split()[0] == "game_1_3"]
+    assert len(slow_attempts) == 2 and slow_attempts[0] != slow_attempts[1]
+    assert os.listdir(queue.claims_dir) == []
+
+
+def test_late_worker_keeps_the_new_owners_claim(tmp_path):
+    queue = JobQueue(str(tmp_path))
+    queue.submit([{"job_id": "game_1_0"}])
+    assert queue.claim_next("a")["job_id"] == "game_1_0"
+
+    old = time.time() - 10 * STALE_SECONDS
+    os.utime(queue.claim_path("game_1_0"), (old, old))
+    assert queue.reclaim_stale(STALE_SECONDS) == ["game_1_0"]
+    assert queue.claim_next("b")["job_id"] == "game_1_0"
+
+    # Worker a wakes up: no heartbeat, completion, failure or release on b's claim
+    queue.heartbeat("game_1_0", "a")
+    assert not queue.complete("game_1_0", {"worker": "a"}, "a")
+    assert not queue.fail("game_1_0", "late", 3, "a")
+    assert not queue.release("game_1_0", "a")
+    assert queue.owner("game_1_0") == "b"
+    assert not queue.is_finished("game_1_0")
+    assert read_json(queue.job_path("game_1_0"))["attempts"] == 0
+
+    assert queue.complete("game_1_0", {"worker": "b"}, "b")
+    assert read_json(queue.done_path("game_1_0")) == {"worker": "b"}
+    assert queue.owner("game_1_0") is None